@@ -0,0 +1,105 @@
+"""
+Memory the host allocates per frame on the send path, as traced by
+tracemalloc: listeners read one capture through their cursors and send
+through AudioSender, the way stream_audio does, onto a data channel stub
+that discards what it's given.
+
+The path is not allocation-free. Two costs are reported apart:
+
+- shared: the bytes put on the wire, built by the first listener to send
+  a frame and reused by the rest. RTCDataChannel.send only takes bytes,
+  so this one copy per frame stays.
+- per listener: what every read and send allocates on top of that, which
+  is the read and send coroutines and the frame tuple. These are freed
+  before the next listener runs, so they are churn and don't grow the
+  host's memory with its listener count. With 20 ms frames this is about
+  330 B for PCM and Opus alike.
+
+    python benchmarks/frame_alloc.py [listeners] [frames]
+
+Needs `parec` on PATH and a PulseAudio default sink (or set BENCH_DEVICE
+to a source name).
+"""
+import asyncio
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from capture import AudioCapture  # noqa: E402
+from codec import OPUS, PCM  # noqa: E402
+from sender import AudioSender  # noqa: E402
+
+WARMUP = 25  # frames read before measuring
+
+PROFILES = [
+    ("pcm, sequenced", PCM, True),
+    ("pcm, legacy", PCM, False),
+    ("opus, sequenced", OPUS, True),
+]
+
+
+class NullChannel:
+    """Just enough of RTCDataChannel for AudioSender."""
+
+    readyState = "open"
+    bufferedAmount = 0
+    bufferedAmountLowThreshold = 0
+
+    def on(self, event, handler):
+        pass
+
+    def send(self, data):
+        pass
+
+
+async def measure(device, label, codec, sequenced, listeners, frames):
+    capture = AudioCapture(device)
+    await capture.start()
+    # Everyone joins together and the clock only moves on once a frame is
+    # out, so every listener's read returns without waiting
+    clock = capture.subscribe()
+    senders = [AudioSender(NullChannel(), capture.subscribe(codec), sequenced) for _ in range(listeners)]
+    # The first listener to send a frame also builds its shared wire bytes
+    first = others = 0
+    for n in range(WARMUP + frames):
+        if not await clock.read():
+            break
+        for i, sender in enumerate(senders):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            frame = await sender.cursor.read()
+            seq, timestamp, pcm_data, payload, voiced = frame
+            await sender.send(seq, timestamp, payload, True)
+            if n >= WARMUP:
+                allocated = tracemalloc.get_traced_memory()[1] - before
+                if i:
+                    others += allocated
+                else:
+                    first += allocated
+            del frame, pcm_data, payload
+    await capture.stop()
+    per_listener = others / (frames * (listeners - 1))
+    print(
+        f"{label:<16} {first / frames - per_listener:>8.0f} B/frame shared "
+        f"{per_listener:>6.0f} B/listener/frame"
+    )
+
+
+async def main(listeners, frames):
+    listeners = max(2, listeners)  # one to build the shared bytes, others to reuse them
+    device = os.getenv("BENCH_DEVICE")
+    if not device:
+        from driver import get_default_monitor
+        device = get_default_monitor()
+    tracemalloc.start()
+    for label, codec, sequenced in PROFILES:
+        await measure(device, label, codec, sequenced, listeners, frames)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+    ))
@@ -0,0 +1,49 @@
+"""
+CPU cost of preparing one join on the host: build a peer connection, add
+the audio data channel and set a gathered offer. Compares a fresh DTLS
+certificate per connection with the shared certificate.
+
+    python benchmarks/join_cpu.py [joins]
+
+No ICE servers are used, so only local work is measured.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["STUN_URLS"] = ""
+
+from aiortc import RTCPeerConnection  # noqa: E402
+from certificate import create_peer_connection  # noqa: E402
+from framing import channel_options  # noqa: E402
+from ice import rtc_config  # noqa: E402
+
+
+async def join(factory):
+    pc = factory()
+    pc.createDataChannel("audio", **channel_options(True))
+    await pc.setLocalDescription(await pc.createOffer())
+    return pc
+
+
+async def measure(label, factory, joins):
+    await (await join(factory)).close()  # warm up imports and the shared certificate
+    pcs = []
+    cpu, wall = time.process_time(), time.perf_counter()
+    for _ in range(joins):
+        pcs.append(await join(factory))
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    for pc in pcs:
+        await pc.close()
+    print(f"{label:<20} {cpu / joins * 1000:7.2f} ms CPU/join {wall / joins * 1000:7.2f} ms wall/join")
+
+
+async def main(joins):
+    await measure("fresh certificate", lambda: RTCPeerConnection(rtc_config), joins)
+    await measure("shared certificate", create_peer_connection, joins)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
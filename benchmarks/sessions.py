@@ -0,0 +1,92 @@
+"""
+How many sessions one driver process can run: starts host sessions on
+separate channels, each with participant sessions in the same process,
+against a local signaling server, and reports CPU use, event-loop lag and
+how much of the expected audio the participants played.
+
+    python benchmarks/sessions.py [max_hosts] [participants_per_host]
+
+Hosts are doubled up to max_hosts. Needs `parec` and `paplay` on PATH and
+a PulseAudio default sink (or set BENCH_DEVICE to a source name).
+"""
+import asyncio
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+with socket.socket() as s:
+    s.bind(("127.0.0.1", 0))
+    PORT = s.getsockname()[1]
+os.environ["SIGNALING_URI"] = f"ws://127.0.0.1:{PORT}/ws"
+os.environ["STUN_URLS"] = ""
+
+import driver  # noqa: E402
+from monitor import LoopLagMonitor  # noqa: E402
+from server import SignalingServer  # noqa: E402
+
+SETTLE = 5  # seconds for joins to finish before measuring
+WINDOW = 10  # seconds measured
+
+
+async def measure(hosts, per_host):
+    sessions = driver.SessionManager(max_sessions=hosts)
+    started = []
+    for h in range(hosts):
+        host = driver.HostSession(None, f"bench-{hosts}-{h}")
+        await sessions.start(host)
+        started.append(host)
+    await asyncio.sleep(1)
+    for h in range(hosts):
+        for _ in range(per_host):
+            # The manager allows one participant per channel; bypass it
+            participant = driver.ParticipantSession(None, f"bench-{hosts}-{h}")
+            await participant.start()
+            started.append(participant)
+    await asyncio.sleep(SETTLE)
+
+    players = [s.player for s in started if isinstance(s, driver.ParticipantSession) and s.player]
+    received = sum(p.stats().get("written", 0) for p in players)
+    monitor = LoopLagMonitor().start()
+    cpu, wall = time.process_time(), time.perf_counter()
+    await asyncio.sleep(WINDOW)
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    received = sum(p.stats().get("written", 0) for p in players) - received
+    lag = monitor.stats()
+    monitor.stop()
+
+    frame_ms = started[0].frame_ms
+    expected = hosts * per_host * wall * 1000 / frame_ms
+    print(
+        f"{hosts:>5} {hosts * per_host:>12} {cpu / wall * 100:>6.1f}% "
+        f"{lag['lag_avg_ms']:>8.2f} {lag['lag_max_ms']:>8.2f} "
+        f"{received / expected * 100 if expected else 0:>9.1f}%",
+        file=sys.stderr,
+    )
+    for session in started:
+        await session.disconnect()
+    await asyncio.gather(*(s.task for s in started if s.task), return_exceptions=True)
+
+
+async def main(max_hosts, per_host):
+    device = os.getenv("BENCH_DEVICE")
+    if device:
+        driver.get_default_monitor = lambda: device
+    server = asyncio.create_task(SignalingServer().serve("127.0.0.1", PORT))
+    await asyncio.sleep(0.5)
+    print(f"{'hosts':>5} {'participants':>12} {'cpu':>7} {'lag avg':>8} {'lag max':>8} {'played':>10}", file=sys.stderr)
+    hosts = 1
+    while hosts <= max_hosts:
+        await measure(hosts, per_host)
+        hosts *= 2
+    server.cancel()
+
+
+if __name__ == "__main__":
+    # Session logging would drown the results, which go to stderr
+    sys.stdout = open(os.devnull, "w")
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 4,
+    ))
@@ -0,0 +1,139 @@
+"""
+How one host session scales with worker processes: a host streams to
+participants run in a separate process, first with every participant on
+the host's event loop, then spread over 1, 2, 4, ... workers. Reports the
+CPU the host and its workers use (in cores), the host's event-loop lag,
+the worst worker's lag and how much of the expected audio was played.
+
+    python benchmarks/workers.py [participants] [max_workers]
+
+Needs `parec` and `paplay` on PATH and a PulseAudio default sink (or set
+BENCH_DEVICE to a source name).
+"""
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+if __name__ == "__main__":
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        os.environ["BENCH_PORT"] = str(s.getsockname()[1])
+PORT = int(os.environ.get("BENCH_PORT", "0"))
+os.environ["SIGNALING_URI"] = f"ws://127.0.0.1:{PORT}/ws"
+os.environ["STUN_URLS"] = ""
+
+import driver  # noqa: E402
+from monitor import LoopLagMonitor  # noqa: E402
+from server import SignalingServer  # noqa: E402
+
+SETTLE = 5  # seconds for joins to finish before measuring
+WINDOW = 10  # seconds measured
+
+
+def cpu_seconds(pids):
+    """User + system CPU time of `pids`, from /proc."""
+    ticks = os.sysconf("SC_CLK_TCK")
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except FileNotFoundError:
+            continue
+        total += int(fields[11]) + int(fields[12])
+    return total / ticks
+
+
+def listen(channel_id, participants, conn):
+    """Participant process: join, then report frames played on request."""
+    sys.stdout = sys.stderr = open(os.devnull, "w")
+
+    async def run():
+        sessions = []
+        for _ in range(participants):
+            session = driver.ParticipantSession(None, channel_id)
+            await session.start()
+            sessions.append(session)
+        loop = asyncio.get_running_loop()
+        while True:
+            if not await loop.run_in_executor(None, conn.recv):
+                break
+            conn.send(sum(s.player.stats().get("written", 0) for s in sessions if s.player))
+        for session in sessions:
+            await session.disconnect()
+
+    asyncio.run(run())
+
+
+async def measure(workers, participants):
+    channel_id = f"bench-{workers}"
+    host = driver.HostSession(None, channel_id, workers=workers)
+    await host.start()
+    await asyncio.sleep(2)
+    conn, listener_conn = multiprocessing.Pipe()
+    listener = multiprocessing.get_context("spawn").Process(
+        target=listen, args=(channel_id, participants, listener_conn), daemon=True
+    )
+    listener.start()
+    await asyncio.sleep(SETTLE)
+
+    loop = asyncio.get_running_loop()
+
+    async def played():
+        conn.send(True)
+        return await loop.run_in_executor(None, conn.recv)
+
+    pids = [os.getpid()] + [worker.process.pid for worker in getattr(host.hub, "workers", [])]
+    received = await played()
+    monitor = LoopLagMonitor().start()
+    cpu, wall = cpu_seconds(pids), time.perf_counter()
+    await asyncio.sleep(WINDOW)
+    cpu, wall = cpu_seconds(pids) - cpu, time.perf_counter() - wall
+    received = await played() - received
+    lag = monitor.stats()
+    monitor.stop()
+    worker_lag = max(
+        (w["loop"]["lag_avg_ms"] for w in host.stats().get("workers", []) if w["loop"]),
+        default=0.0,
+    )
+
+    expected = participants * wall * 1000 / host.frame_ms
+    print(
+        f"{workers:>7} {participants:>12} {cpu / wall:>6.2f} "
+        f"{lag['lag_avg_ms']:>9.2f} {worker_lag:>10.2f} "
+        f"{received / expected * 100 if expected else 0:>9.1f}%",
+        file=sys.stderr,
+    )
+    conn.send(False)
+    await loop.run_in_executor(None, listener.join, 5)
+    await host.disconnect()
+    if host.task:
+        await asyncio.gather(host.task, return_exceptions=True)
+
+
+async def main(participants, max_workers):
+    device = os.getenv("BENCH_DEVICE")
+    if device:
+        driver.get_default_monitor = lambda: device
+    server = asyncio.create_task(SignalingServer().serve("127.0.0.1", PORT))
+    await asyncio.sleep(0.5)
+    print(f"cpu count {os.cpu_count()}", file=sys.stderr)
+    print(f"{'workers':>7} {'participants':>12} {'cores':>6} {'host lag':>9} {'worker lag':>10} {'played':>10}", file=sys.stderr)
+    workers = 0
+    while workers <= max_workers:
+        await measure(workers, participants)
+        workers = workers * 2 if workers else 1
+    server.cancel()
+
+
+if __name__ == "__main__":
+    # Session logging would drown the results, which go to stderr
+    sys.stdout = open(os.devnull, "w")
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 16,
+        int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1,
+    ))
@@ -0,0 +1,288 @@
+import asyncio
+import math
+import subprocess
+import threading
+import numpy as np
+from codec import PCM, OPUS_BIT_RATES, OpusEncoder, check_frame_ms, frame_bytes
+from config import FRAME_MS, VAD_HANGOVER_MS
+from framing import capture_timestamp, pack_frame
+from vad import VoiceActivityDetector
+
+
+class CaptureCursor:
+    """Read position of a single listener in the shared capture ring."""
+
+    def __init__(self, capture, codec=PCM):
+        self.capture = capture
+        self.codec = codec
+        self.seq = capture.seq  # join at the live edge
+        self.skipped = 0
+
+    def read(self):
+        """
+        Wait for the next frame and return it as
+        (seq, timestamp, pcm_data, payload, voiced), where payload is the
+        frame in this listener's codec (None if it wasn't encoded for that
+        codec) and voiced is the capture-wide VAD decision. Returns None
+        once the capture has stopped.
+
+        pcm_data (and payload, for PCM) is a read-only view into the ring,
+        shared with every other listener and overwritten once the capture
+        laps it: use it right away or copy it.
+        """
+        # Hand back the capture's coroutine rather than wrapping it in another
+        return self.capture.read(self)
+
+    @property
+    def lag(self):
+        """Frames captured but not yet read by this listener."""
+        return self.capture.seq - self.seq
+
+    def skip_to_live(self):
+        """Drop this listener's backlog. Returns the number of frames skipped."""
+        skipped = self.lag
+        self.seq = self.capture.seq
+        return skipped
+
+    def close(self):
+        self.capture.unsubscribe(self)
+
+
+class AudioCapture:
+    """
+    One parec process per host session, read on a dedicated thread. Every
+    frame is read once, with readinto, straight into a preallocated ring
+    buffer, and each listener walks it with its own cursor, so a slow
+    listener falls behind (and eventually skips ahead) without holding up
+    the others. The thread stamps and VAD-gates each frame as it arrives
+    and only then wakes the event loop, so a busy loop delays sending but
+    never the next read from parec.
+
+    While any listener uses an Opus tier, each frame is also encoded
+    exactly once per tier and the same packet is handed to all of them.
+    Voice activity is likewise decided once per frame, not per listener,
+    and the bytes put on the wire are built once per frame and format.
+    Listeners get read-only views of the ring slots, so reading a frame
+    copies nothing.
+    """
+
+    def __init__(self, device, frame_ms=FRAME_MS, ring_ms=1000):
+        self.device = device
+        self.frame_ms = check_frame_ms(frame_ms)
+        self.frame_bytes = frame_bytes(frame_ms)
+        ring_frames = max(2, int(ring_ms / frame_ms))
+        self.buffer = np.zeros((ring_frames, self.frame_bytes), dtype=np.uint8)
+        self.ring = [memoryview(row) for row in self.buffer]
+        self.views = [view.toreadonly() for view in self.ring]  # handed to listeners
+        self.samples = list(self.buffer.view(np.int16))  # the same slots, for the VAD
+        self.wire = [[] for _ in range(ring_frames)]  # (payload, sequenced, bytes) per slot
+        self.encoded = {codec: [None] * ring_frames for codec in OPUS_BIT_RATES}
+        self.encoders = {}
+        self.timestamps = [0] * ring_frames
+        self.voiced = [False] * ring_frames
+        self.vad = VoiceActivityDetector(int(VAD_HANGOVER_MS / self.frame_ms))
+        self.seq = 0  # sequence number of the next frame listeners will see
+        self.written = 0  # sequence number of the next frame the thread reads
+        self.cursors = set()
+        self.process = None
+        self.thread = None
+        self.loop = None
+        self.running = False
+        self._publish_pending = False
+        self._frame_ready = asyncio.Event()
+
+    async def start(self):
+        if self.running:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.process = subprocess.Popen(
+            [
+                "parec",
+                "--device", self.device,
+                "--format=s16le",
+                "--rate", "48000",
+                "--channels", "2",
+                f"--latency-msec={max(1, math.ceil(self.frame_ms))}",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+        self.running = True
+        self.thread = threading.Thread(target=self._run, args=(self.process.stdout,), name="parec-reader", daemon=True)
+        self.thread.start()
+
+    def _run(self, stdout):
+        try:
+            while self.running:
+                slot = self.written % len(self.ring)
+                view = self.ring[slot]
+                filled = stdout.readinto(view)
+                while filled and filled < self.frame_bytes:
+                    # Short reads are rare; only they need a sliced view
+                    n = stdout.readinto(view[filled:])
+                    filled = filled + n if n else 0
+                if not filled:
+                    return
+                self.timestamps[slot] = capture_timestamp()
+                self.voiced[slot] = self.vad.update(self.samples[slot])
+                self.written += 1
+                # One pending wakeup covers every frame read before it runs
+                if not self._publish_pending:
+                    self._publish_pending = True
+                    self._call(self._publish)
+        except Exception as e:
+            if self.running:
+                print(f"Error capturing audio: {e}")
+        finally:
+            self._call(self._ended)
+
+    def _call(self, callback):
+        try:
+            self.loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            pass  # loop already closed
+
+    def _publish(self):
+        self._publish_pending = False
+        written = self.written
+        # Frames the thread has lapped are dropped before listeners see them
+        self.seq = max(self.seq, written - len(self.ring) + 1)
+        while self.seq < written:
+            slot = self.seq % len(self.ring)
+            self._encode(slot, self.views[slot])
+            self.seq += 1
+        self._wake()
+
+    def _ended(self):
+        self.running = False
+        self._wake()
+
+    def _encode(self, slot, pcm_data):
+        self.wire[slot].clear()
+        in_use = {cursor.codec for cursor in self.cursors}
+        for codec, ring in self.encoded.items():
+            ring[slot] = None
+            if codec not in in_use:
+                continue
+            encoder = self.encoders.get(codec)
+            if encoder is None:
+                encoder = self.encoders[codec] = OpusEncoder(
+                    bit_rate=OPUS_BIT_RATES[codec], frame_ms=self.frame_ms
+                )
+            try:
+                ring[slot] = encoder.encode(pcm_data)
+            except Exception as e:
+                print(f"Error encoding audio: {e}")
+
+    def _wake(self):
+        # Swap in a fresh event so every reader blocked on the old one wakes once
+        self._frame_ready.set()
+        self._frame_ready = asyncio.Event()
+
+    def subscribe(self, codec=PCM):
+        cursor = CaptureCursor(self, codec)
+        self.cursors.add(cursor)
+        return cursor
+
+    def unsubscribe(self, cursor):
+        self.cursors.discard(cursor)
+
+    async def read(self, cursor):
+        while cursor.seq >= self.seq:
+            if not self.running:
+                return None
+            await self._frame_ready.wait()
+
+        # The slot after the newest frame may be being overwritten already
+        oldest = self.written - len(self.ring) + 1
+        if cursor.seq < oldest:
+            cursor.skipped += oldest - cursor.seq
+            cursor.seq = oldest
+
+        seq = cursor.seq
+        slot = seq % len(self.ring)
+        cursor.seq += 1
+        pcm_data = self.views[slot]
+        payload = pcm_data if cursor.codec == PCM else self.encoded[cursor.codec][slot]
+        return seq, self.timestamps[slot], pcm_data, payload, self.voiced[slot]
+
+    def wire_frame(self, seq, timestamp, payload, sequenced):
+        """
+        `payload`, as read for frame `seq`, in the form the data channel
+        takes: bytes, behind a sequenced header if asked for. Built by the
+        first listener to send it and shared with the rest.
+        """
+        entries = self.wire[seq % len(self.ring)]
+        for cached, cached_sequenced, frame in entries:
+            if cached is payload and cached_sequenced == sequenced:
+                return frame
+        frame = pack_frame(seq, timestamp, payload) if sequenced else bytes(payload)
+        entries.append((payload, sequenced, frame))
+        return frame
+
+    async def stop(self):
+        self.running = False
+        process = self.process
+        self.process = None
+        if process and process.poll() is None:
+            try:
+                process.terminate()
+                try:
+                    await asyncio.to_thread(process.wait, timeout=1)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            except ProcessLookupError:
+                pass
+            except Exception as e:
+                print(f"Error cleaning up audio process: {e}")
+
+        # parec exiting closes the pipe, which ends the thread's read
+        thread = self.thread
+        self.thread = None
+        if thread:
+            await asyncio.to_thread(thread.join, 1)
+        if process:
+            process.stdout.close()
+
+        self.cursors.clear()
+        self._wake()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+
+class SharedCaptures:
+    """
+    Captures shared by the host sessions of one process: sessions on the
+    same device and frame duration read one parec through their own
+    cursors, and it is stopped when the last of them releases it.
+    """
+
+    def __init__(self):
+        self.captures = {}  # (device, frame_ms) -> [capture, sessions using it]
+
+    async def acquire(self, device, frame_ms=FRAME_MS):
+        key = (device, check_frame_ms(frame_ms))
+        entry = self.captures.get(key)
+        if entry is None or not entry[0].running:
+            capture = AudioCapture(device, frame_ms)
+            await capture.start()
+            entry = self.captures[key] = [capture, 0]
+        entry[1] += 1
+        return entry[0]
+
+    async def release(self, capture):
+        for key, entry in list(self.captures.items()):
+            if entry[0] is capture:
+                entry[1] -= 1
+                if entry[1] > 0:
+                    return
+                del self.captures[key]
+                break
+        # Last user gone, or a capture that ended and was replaced
+        await capture.stop()
@@ -0,0 +1,54 @@
+import time
+import aiortc.rtcpeerconnection
+from aiortc import RTCCertificate, RTCPeerConnection
+from config import DTLS_CERT_MAX_AGE
+from ice import rtc_config
+
+
+class SharedCertificate:
+    """
+    One DTLS certificate for every peer connection this process creates,
+    replaced once it is DTLS_CERT_MAX_AGE hours old (aiortc certificates are
+    valid for 30 days). Connections keep the certificate they were created
+    with, so rotating never affects a running session.
+
+    Generating a certificate means an EC key pair and a signature, a few
+    milliseconds of CPU on the event loop for every join otherwise.
+    """
+
+    def __init__(self, max_age=DTLS_CERT_MAX_AGE):
+        self.max_age = max_age * 3600
+        self.certificate = None
+        self.created = 0.0
+        self.generated = 0
+
+    def get(self):
+        now = time.monotonic()
+        if self.certificate is None or now - self.created >= self.max_age:
+            self.certificate = RTCCertificate.generateCertificate()
+            self.created = now
+            self.generated += 1
+        return self.certificate
+
+    def generateCertificate(self):
+        # Stands in for the RTCCertificate class while a connection is built
+        return self.get()
+
+
+shared_certificate = SharedCertificate()
+
+
+def create_peer_connection(configuration=rtc_config):
+    """
+    RTCPeerConnection using the shared DTLS certificate. aiortc generates a
+    certificate in the constructor and has no option to pass one, so the
+    class it calls is swapped for the duration of the call. Each
+    connection's SDP fingerprint is computed from the certificate it holds,
+    as before.
+    """
+    module = aiortc.rtcpeerconnection
+    module.RTCCertificate = shared_certificate
+    try:
+        return RTCPeerConnection(configuration)
+    finally:
+        module.RTCCertificate = RTCCertificate
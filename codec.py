@@ -0,0 +1,107 @@
+import av
+
+PCM = "pcm"
+OPUS = "opus"
+# Host-side only: a lower-bitrate Opus stream that any Opus decoder can
+# play, used to shed load for congested listeners
+OPUS_LOW = "opus-low"
+
+OPUS_BIT_RATES = {OPUS: 96000, OPUS_LOW: 24000}
+
+# Codecs in order of preference. Peers that don't advertise anything only
+# understand raw PCM.
+SUPPORTED_CODECS = [OPUS, PCM]
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+BYTES_PER_MS = SAMPLE_RATE * CHANNELS * 2 // 1000
+
+# Frame durations Opus can packetize, and so the ones a session may use
+FRAME_DURATIONS_MS = (2.5, 5, 10, 20, 40, 60)
+
+
+def check_frame_ms(frame_ms):
+    if frame_ms not in FRAME_DURATIONS_MS:
+        raise ValueError(
+            f"Unsupported frame duration {frame_ms} ms, use one of {FRAME_DURATIONS_MS}"
+        )
+    return frame_ms
+
+
+def frame_bytes(frame_ms):
+    """Size of one s16le frame of the given duration."""
+    return int(frame_ms * BYTES_PER_MS)
+
+
+def layout_name(channels):
+    return "stereo" if channels == 2 else "mono"
+
+
+def pcm_to_frame(pcm_data, pts, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """Wrap an s16le interleaved buffer in an av.AudioFrame."""
+    samples = len(pcm_data) // (2 * channels)
+    frame = av.AudioFrame(format="s16", layout=layout_name(channels), samples=samples)
+    frame.planes[0].update(pcm_data)
+    frame.sample_rate = sample_rate
+    frame.pts = pts
+    return frame
+
+
+class PcmConverter:
+    """Converts decoded av.AudioFrames of any format to s16le interleaved PCM."""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+        self.resampler = av.AudioResampler(
+            format="s16", layout=layout_name(channels), rate=sample_rate
+        )
+
+    def convert(self, frame):
+        pcm_data = bytearray()
+        for resampled in self.resampler.resample(frame):
+            pcm_data += resampled.to_ndarray().tobytes()
+        return bytes(pcm_data)
+
+
+def choose_codec(offered, preferred=SUPPORTED_CODECS):
+    """Pick the first preferred codec the remote peer also supports."""
+    offered = offered or [PCM]
+    for codec in preferred:
+        if codec in offered:
+            return codec
+    return PCM
+
+
+class OpusEncoder:
+    """Encodes s16le interleaved frames into one Opus packet per frame."""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=CHANNELS, bit_rate=96000, frame_ms=20):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.context = av.CodecContext.create("libopus", "w")
+        self.context.sample_rate = sample_rate
+        self.context.layout = layout_name(channels)
+        self.context.format = "s16"
+        self.context.bit_rate = bit_rate
+        self.context.options = {"frame_duration": f"{frame_ms:g}"}
+        self.pts = 0
+
+    def encode(self, pcm_data):
+        frame = pcm_to_frame(pcm_data, self.pts, self.sample_rate, self.channels)
+        self.pts += frame.samples
+        return b"".join(bytes(packet) for packet in self.context.encode(frame))
+
+
+class OpusDecoder:
+    """Decodes Opus packets back into s16le interleaved PCM."""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+        self.context = av.CodecContext.create("opus", "r")
+        self.context.sample_rate = sample_rate
+        self.context.layout = layout_name(channels)
+        self.converter = PcmConverter(sample_rate, channels)
+
+    def decode(self, packet):
+        return b"".join(
+            self.converter.convert(frame)
+            for frame in self.context.decode(av.Packet(packet))
+        )
@@ -0,0 +1,122 @@
+import os
+
+# WebSocket signaling server shared by hosts and participants. Run your own
+# with `python -m server` and point this at ws://<host>:8765/ws.
+SIGNALING_URI = os.getenv("SIGNALING_URI", "wss://jam-ws-server.onrender.com/ws")
+
+# ICE servers. STUN_URLS is a comma separated list; a TURN server is only
+# used when TURN_URL is set.
+STUN_URLS = [url for url in os.getenv("STUN_URLS", "stun:stun.l.google.com:19302").split(",") if url]
+TURN_URL = os.getenv("TURN_URL") or None
+TURN_USERNAME = os.getenv("TURN_USERNAME")
+TURN_CREDENTIAL = os.getenv("TURN_CREDENTIAL")
+
+# Trickle ICE: send the offer/answer as soon as host candidates are known
+# and stream server-reflexive candidates after it, instead of waiting for
+# STUN. Both peers must enable it and the signaling server must relay
+# "candidate" messages (python -m server does). Ignored when TURN_URL is set.
+ICE_TRICKLE = os.getenv("ICE_TRICKLE", "0") == "1"
+
+# Hours one DTLS certificate is reused for new peer connections before a
+# fresh one is generated (aiortc certificates are valid for 30 days).
+DTLS_CERT_MAX_AGE = float(os.getenv("DTLS_CERT_MAX_AGE", "24"))
+
+# Upper bound, in seconds, of the jittered exponential backoff a host uses
+# to reconnect to the signaling server. Established participants keep
+# streaming while it is away.
+SIGNALING_RECONNECT_MAX = float(os.getenv("SIGNALING_RECONNECT_MAX", "30"))
+
+# Host and participant sessions one driver process runs at once.
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "32"))
+
+# Worker processes a host session spreads its participants over, each with
+# its own event loop and peer connections, fed the captured audio through
+# shared memory. 0 keeps every participant on the driver's event loop.
+HOST_WORKERS = int(os.getenv("HOST_WORKERS", "0"))
+
+# Participants a host closes at once when its session ends, and the seconds
+# that teardown may take before connections still closing are abandoned.
+TEARDOWN_CONCURRENCY = int(os.getenv("TEARDOWN_CONCURRENCY", "16"))
+TEARDOWN_TIMEOUT = float(os.getenv("TEARDOWN_TIMEOUT", "5"))
+
+# Seconds a participant keeps trying to renegotiate a dropped connection
+# (keeping its signaling socket and player) before giving up, and a host
+# whose last participant dropped waits for it to come back.
+RESUME_GRACE = float(os.getenv("RESUME_GRACE", "20"))
+
+# Participants negotiated with at once, across all host sessions in the
+# process. Joins beyond this wait for a slot while the signaling loops keep
+# serving everyone else.
+NEGOTIATION_CONCURRENCY = int(os.getenv("NEGOTIATION_CONCURRENCY", "8"))
+
+# Pool of peer connections the host prepares ahead of joins (data channel
+# created, offer gathered). It holds as many as joined in the last minute,
+# between POOL_MIN_SIZE and POOL_MAX_SIZE (0 disables pooling); entries
+# older than POOL_MAX_AGE seconds are rebuilt so their NAT bindings stay fresh.
+POOL_MIN_SIZE = int(os.getenv("POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("POOL_MAX_SIZE", "4"))
+POOL_MAX_AGE = float(os.getenv("POOL_MAX_AGE", "30"))
+
+# Session frame duration in ms (2.5, 5, 10, 20, 40 or 60). Capture reads,
+# VAD windows, send cadence and playout buffering all follow from it:
+# jam sessions want 5 ms, listen-only sessions 40-60 ms to cut per-packet
+# overhead.
+FRAME_MS = float(os.getenv("FRAME_MS", "20"))
+
+# Transport the host uses for audio when the participant supports both:
+# "datachannel" (SCTP data channel) or "rtp" (aiortc MediaStreamTrack).
+AUDIO_TRANSPORT = os.getenv("AUDIO_TRANSPORT", "datachannel")
+
+# Delivery of the audio data channel for participants that understand
+# sequenced frames. Unordered, with either a retransmit limit (0 = never
+# retransmit) or, if set, a lifetime budget in milliseconds.
+AUDIO_MAX_RETRANSMITS = int(os.getenv("AUDIO_MAX_RETRANSMITS", "0"))
+AUDIO_MAX_PACKET_LIFE_TIME = (
+    int(os.environ["AUDIO_MAX_PACKET_LIFE_TIME"])
+    if os.getenv("AUDIO_MAX_PACKET_LIFE_TIME") else None
+)
+
+# Per-participant send budget, in ms of audio queued on the data channel,
+# and what to do once a listener is over it: "drop_oldest", "drop_newest"
+# or "downgrade" (switch Opus listeners to a lower bitrate).
+AUDIO_SEND_BUDGET_MS = int(os.getenv("AUDIO_SEND_BUDGET_MS", "200"))
+AUDIO_DROP_POLICY = os.getenv("AUDIO_DROP_POLICY", "drop_oldest")
+
+# Voice activity detection, run once per captured frame. A frame opens the
+# gate above VAD_OPEN_THRESHOLD RMS and the gate closes only after
+# VAD_HANGOVER_MS below VAD_CLOSE_THRESHOLD.
+VAD_OPEN_THRESHOLD = int(os.getenv("VAD_OPEN_THRESHOLD", "500"))
+VAD_CLOSE_THRESHOLD = int(os.getenv("VAD_CLOSE_THRESHOLD", "350"))
+VAD_HANGOVER_MS = int(os.getenv("VAD_HANGOVER_MS", "200"))
+
+# While the gate is closed, sequenced participants get a "silence for N
+# frames" marker every DTX_MARKER_MS instead of audio, and play it out as
+# comfort noise with this peak amplitude (0 = digital silence). Markers
+# trail the frames they cover, so a longer interval saves packets at the
+# cost of that much playout delay.
+DTX_MARKER_MS = int(os.getenv("DTX_MARKER_MS", "20"))
+COMFORT_NOISE_LEVEL = int(os.getenv("COMFORT_NOISE_LEVEL", "0"))
+
+# Participant jitter buffer bounds in ms. Within them the playout delay
+# tracks the measured interarrival jitter; the minimum defaults to two
+# frames and never goes below the host's DTX_MARKER_MS plus one frame.
+JITTER_MIN_DELAY_MS = (
+    float(os.environ["JITTER_MIN_DELAY_MS"])
+    if os.getenv("JITTER_MIN_DELAY_MS") else None
+)
+JITTER_MAX_DELAY_MS = float(os.getenv("JITTER_MAX_DELAY_MS", "500"))
+
+# Most audio a participant queues for paplay, in ms. The writer thread drops
+# the oldest frames beyond this if the audio device stalls.
+PLAYBACK_QUEUE_MS = int(os.getenv("PLAYBACK_QUEUE_MS", "200"))
+
+# Participant packet loss concealment for sequenced streams: "wsola"
+# (extend the last pitch period) or "repeat" (repeat the last frame), fading
+# to silence over PLC_FADE_MS of consecutive loss.
+PLC_MODE = os.getenv("PLC_MODE", "wsola")
+PLC_FADE_MS = int(os.getenv("PLC_FADE_MS", "60"))
+
+# Largest playback rate correction, in parts per million, a participant
+# applies to absorb clock drift between the host's capture and its own
+# sound card (5000 = 0.5 %).
+DRIFT_MAX_PPM = int(os.getenv("DRIFT_MAX_PPM", "5000"))
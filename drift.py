@@ -0,0 +1,155 @@
+import numpy as np
+from config import DRIFT_MAX_PPM
+from framing import seq_diff
+
+# Fill error (in frames) to resampling correction. One frame over target
+# speeds playout up by 0.1 %, i.e. it is worked off in about 20 s.
+FILL_GAIN = 0.001
+# Smoothing of the jitter buffer depth seen by the fill controller
+FILL_SMOOTHING = 0.02
+
+
+class RateEstimator:
+    """
+    Least-squares rate of a counter against local time, over a sliding
+    window of points taken at most once per `spacing` seconds.
+    """
+
+    def __init__(self, points=120, spacing=1.0, min_points=10):
+        self.times = np.zeros(points)
+        self.values = np.zeros(points)
+        self.spacing = spacing
+        self.min_points = min_points
+        self.count = 0
+        self.origin = None
+        self.last_time = None
+
+    def add(self, now, value):
+        if self.last_time is not None and now - self.last_time < self.spacing:
+            return
+        if self.origin is None:
+            self.origin = (now, value)
+        slot = self.count % len(self.times)
+        # Relative to the first point so float64 keeps its precision
+        self.times[slot] = now - self.origin[0]
+        self.values[slot] = value - self.origin[1]
+        self.count += 1
+        self.last_time = now
+
+    @property
+    def rate(self):
+        n = min(self.count, len(self.times))
+        if n < self.min_points:
+            return None
+        t = self.times[:n] - self.times[:n].mean()
+        v = self.values[:n] - self.values[:n].mean()
+        return float(t @ v) / float(t @ t)
+
+
+class DriftEstimator:
+    """
+    Compares how fast frames arrive from the host (its capture clock) with
+    how fast paplay consumes samples (the local sound card clock) and turns
+    the difference, plus any slow creep in jitter buffer fill, into a
+    resampling ratio. A ratio above 1 stretches playback, below 1
+    compresses it.
+    """
+
+    def __init__(self, frame_samples, sample_rate, max_ppm=DRIFT_MAX_PPM):
+        self.frame_samples = frame_samples
+        self.sample_rate = sample_rate
+        self.max_correction = max_ppm / 1e6
+        self.arrivals = RateEstimator()
+        self.consumption = RateEstimator()
+        self.first_seq = None
+        self.fill_error = 0.0
+        self.ratio = 1.0
+
+    def arrived(self, now, seq):
+        if self.first_seq is None:
+            self.first_seq = seq
+        self.arrivals.add(now, seq_diff(seq, self.first_seq))
+
+    def consumed(self, now, samples):
+        self.consumption.add(now, samples)
+
+    @property
+    def drift(self):
+        """Relative rate of the local sound card to the host's capture, or 1."""
+        arrival_rate = self.arrivals.rate
+        consumption_rate = self.consumption.rate
+        if not arrival_rate or not consumption_rate:
+            return 1.0
+        return consumption_rate / (arrival_rate * self.frame_samples)
+
+    def update(self, depth, target):
+        """Recompute the ratio once per playout tick from the buffer fill."""
+        self.fill_error += (depth - target - self.fill_error) * FILL_SMOOTHING
+        ratio = self.drift * (1 - FILL_GAIN * self.fill_error)
+        self.ratio = min(max(ratio, 1 - self.max_correction), 1 + self.max_correction)
+        return self.ratio
+
+    def stats(self):
+        return {
+            "drift_ppm": round((self.drift - 1) * 1e6, 1),
+            "resample_ratio": round(self.ratio, 6),
+        }
+
+
+class Resampler:
+    """
+    Stretches or compresses s16le frames by a ratio close to 1 using linear
+    interpolation. The fractional read position carries over from frame to
+    frame, so the output is one continuous signal with no seams.
+    """
+
+    def __init__(self, frame_samples, channels, max_ratio=1.01):
+        self.frame_samples = frame_samples
+        self.channels = channels
+        max_out = int(frame_samples * max_ratio) + 2
+        self.steps = np.arange(max_out, dtype=np.float64)
+        self.positions = np.empty(max_out, dtype=np.float64)
+        self.index = np.empty(max_out, dtype=np.intp)
+        self.frac = np.empty((max_out, 1), dtype=np.float32)
+        self.left = np.empty((max_out, channels), dtype=np.float32)
+        self.right = np.empty((max_out, channels), dtype=np.float32)
+        self.out = np.empty((max_out, channels), dtype=np.int16)
+        # Last sample of the previous frame followed by the current frame
+        self.buffer = np.zeros((frame_samples + 1, channels), dtype=np.float32)
+        self.position = 1.0
+
+    def process(self, pcm_data, ratio):
+        frame = np.frombuffer(pcm_data, dtype=np.int16).reshape(-1, self.channels)
+        if len(frame) != self.frame_samples:
+            return pcm_data
+        if ratio == 1 and self.position == 1:
+            self.buffer[0] = frame[-1]
+            return pcm_data
+        self.buffer[1:] = frame
+
+        step = 1 / ratio
+        last = self.frame_samples
+        count = int((last - self.position) / step) + 1
+        positions = self.positions[:count]
+        np.multiply(self.steps[:count], step, out=positions)
+        positions += self.position
+
+        index = self.index[:count]
+        index[:] = positions  # positions are positive, so this floors
+        frac = self.frac[:count]
+        np.subtract(positions, index, out=frac[:, 0], casting="unsafe")
+        left = np.take(self.buffer, index, axis=0, out=self.left[:count])
+        np.minimum(index + 1, last, out=index)
+        right = np.take(self.buffer, index, axis=0, out=self.right[:count])
+
+        # left + (right - left) * frac
+        right -= left
+        right *= frac
+        left += right
+        out = self.out[:count]
+        np.rint(left, out=left)
+        np.copyto(out, left, casting="unsafe")
+
+        self.position = positions[-1] + step - last
+        self.buffer[0] = self.buffer[last]
+        return out.tobytes()
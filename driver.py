@@ -1,10 +1,10 @@
 import asyncio
 import websockets
 import uuid
-from aiortc import RTCPeerConnection, RTCSessionDescription, RTCIceServer, RTCConfiguration
+from aiortc import RTCSessionDescription
 import subprocess
-import numpy as np
 import json
+from abc import ABC, abstractmethod
 from asyncio import Lock
 from fastapi import FastAPI, Request
 from fastapi.templating import Jinja2Templates
@@ -13,6 +13,21 @@ from fastapi.responses import HTMLResponse, JSONResponse
 import uvicorn
 from pathlib import Path
 from pydantic import BaseModel
+from capture import SharedCaptures
+from certificate import create_peer_connection
+from codec import SUPPORTED_CODECS, PCM, check_frame_ms
+from config import FRAME_MS, HOST_WORKERS, MAX_SESSIONS, RESUME_GRACE, SIGNALING_URI, TEARDOWN_TIMEOUT
+from framing import SUPPORTED_FEATURES
+from hub import ParticipantHub
+from ice import (
+    ICE_FEATURES, add_remote_candidate, defer_server_candidates, local_sdp,
+    trickle_candidates,
+)
+from monitor import LoopLagMonitor
+from playback import AudioPlayer
+from reconnect import Reconnector
+from rtp import SUPPORTED_TRANSPORTS, play_track
+from workers import WorkerPool
 
 # Create necessary directories
 Path("templates").mkdir(exist_ok=True)
@@ -25,35 +40,20 @@ app = FastAPI()
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Common configurations
-ice_servers = [
-    RTCIceServer(urls=["stun:stun.l.google.com:19302"]),
-    RTCIceServer(
-        urls=["turn:your.turn.server:3478"],
-        username="your_username",
-        credential="your_password"
-    )
-]
-rtc_config = RTCConfiguration(iceServers=ice_servers)
-
-# Host-specific variables
-participants = {}
-data_channels = {}
-cleanup_locks = {}
-DEVICE = None
-current_server_mode = None
-current_channel_id = None
-server_lock = Lock()
-active_connection = None
+loop_monitor = LoopLagMonitor()
 
 # Request models
 class ConnectionRequest(BaseModel):
     mode: str
     channel_id: str
+    frame_ms: float = FRAME_MS
+    session_id: str | None = None
+    device: str | None = None  # hosts only; the default sink's monitor if unset
 
 class DisconnectRequest(BaseModel):
-    mode: str
-    channel_id: str
+    mode: str | None = None
+    channel_id: str | None = None
+    session_id: str | None = None
 
 # FastAPI routes
 @app.get("/", response_class=HTMLResponse)
@@ -61,87 +61,62 @@ async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.get("/check-mode")
-async def check_mode():
-    global active_connection
-    # Clean up completed or cancelled connections
-    if active_connection and (active_connection.done() or active_connection.cancelled()):
-        await clear_server_mode()
-    
-    return {
-        "mode": current_server_mode,
-        "channel_id": current_channel_id,
-        "active": bool(active_connection and not active_connection.done())
-    }
+async def check_mode(session_id: str | None = None):
+    if session_id is None:
+        return {"sessions": [session.info() for session in sessions.all()]}
+    session = sessions.get(session_id)
+    if not session:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": f"Session {session_id} not found"}
+        )
+    return session.info()
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    loop_monitor.start()
+
+@app.get("/stats")
+async def stats(session_id: str | None = None):
+    if session_id is None:
+        return {
+            "loop": loop_monitor.stats(),
+            "sessions": {session.session_id: session.stats() for session in sessions.all()},
+        }
+    session = sessions.get(session_id)
+    if not session:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": f"Session {session_id} not found"}
+        )
+    return {"loop": loop_monitor.stats(), **session.stats()}
 
-class ServerModeError(Exception):
+class SessionError(Exception):
     pass
 
-async def check_and_set_server_mode(mode: str, channel_id: str) -> bool:
-    global current_server_mode, current_channel_id, active_connection
-    
-    async with server_lock:
-        if current_server_mode:
-            if current_server_mode == mode and current_channel_id == channel_id and active_connection and not active_connection.done():
-                # Already connected with same mode and channel
-                raise ServerModeError(f"Already connected in {current_server_mode} mode")
-            elif current_server_mode != mode:
-                # Different mode attempting to connect
-                raise ServerModeError(f"Server is already running in {current_server_mode} mode")
-            elif active_connection and not active_connection.done():
-                # Connection exists and is still running
-                raise ServerModeError(f"A connection is already active")
-            else:
-                # Previous connection is done, allow new connection
-                current_server_mode = mode
-                current_channel_id = channel_id
-                return True
-        else:
-            # No active mode - allow connection
-            current_server_mode = mode
-            current_channel_id = channel_id
-            return True
-
-async def clear_server_mode():
-    global current_server_mode, current_channel_id, active_connection
-    async with server_lock:
-        current_server_mode = None
-        current_channel_id = None
-        if active_connection:
-            active_connection.cancel()
-            active_connection = None
-
 @app.post("/connect")
 async def connect(request: ConnectionRequest):
-    global active_connection
-    
     try:
-        # Check if mode can be activated
-        await check_and_set_server_mode(request.mode, request.channel_id)
-        
-        # Cancel any existing connection
-        if active_connection and not active_connection.done():
-            active_connection.cancel()
-            await asyncio.sleep(0.1)  # Give it a moment to clean up
-        
-        # Start new connection
         if request.mode == "host":
-            active_connection = asyncio.create_task(host_connect(request.channel_id))
+            check_frame_ms(request.frame_ms)
+            session = HostSession(request.session_id, request.channel_id, request.frame_ms, device=request.device)
         else:
-            active_connection = asyncio.create_task(user_connect(request.channel_id))
-        
+            session = ParticipantSession(request.session_id, request.channel_id)
+        await sessions.start(session)
+
         return JSONResponse({
             "status": "success", 
             "message": f"Connected as {request.mode}",
-            "mode": current_server_mode,
-            "channel_id": current_channel_id
+            "session_id": session.session_id,
+            "mode": session.mode,
+            "channel_id": session.channel_id
         })
-    except ServerModeError as e:
+    except (SessionError, ValueError) as e:
         return JSONResponse(
             status_code=400,
             content={"status": "error", "message": str(e)}
         )
     except Exception as e:
-        await clear_server_mode()  # Clear mode if connection fails
         return JSONResponse(
             status_code=500,
             content={"status": "error", "message": str(e)}
@@ -150,18 +125,13 @@ async def connect(request: ConnectionRequest):
 @app.post("/disconnect")
 async def disconnect(request: DisconnectRequest):
     try:
-        if request.mode == "host":
-            # Close all participant connections
-            for participant_id in list(participants.keys()):
-                pc = participants[participant_id]
-                await delete_participant(pc)
+        if request.session_id:
+            session = sessions.get(request.session_id)
+            ending = [session] if session else []
         else:
-            # Close participant connection
-            if request.channel_id in participants:
-                pc = participants[request.channel_id]
-                await delete_participant(pc)
-        
-        await clear_server_mode()
+            # Clients that don't keep the session id end it by mode and channel
+            ending = sessions.find(request.mode, request.channel_id)
+        await asyncio.gather(*(session.disconnect() for session in ending))
         return JSONResponse({
             "status": "success", 
             "message": "Disconnected successfully"
@@ -172,231 +142,214 @@ async def disconnect(request: DisconnectRequest):
             "message": str(e)
         })
 
-# Host-specific functions
-async def delete_participant(pc):
-    try:
-        participant_key = next((k for k, v in participants.items() if v == pc), None)
-        if not participant_key:
-            print("Participant already deleted")
-            return
-
-        if participant_key in cleanup_locks:
-            print(f"Cleanup already in progress for {participant_key}")
-            return
-            
-        cleanup_locks[participant_key] = True
-        print(f"Starting cleanup for participant {participant_key}")
-        
+class Session(ABC):
+    """
+    One host or participant connection to a channel, run as its own task
+    with its own signaling socket. Ends when its task does.
+    """
+    mode = None
+
+    def __init__(self, session_id, channel_id):
+        self.session_id = session_id or str(uuid.uuid4())
+        self.channel_id = channel_id
+        self.active = True
+        self.task = None
+
+    @property
+    def running(self):
+        return self.active and self.task is not None and not self.task.done()
+
+    async def prepare(self):
+        """Checks before the session is admitted; run outside the manager's lock."""
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    @abstractmethod
+    async def run(self):
+        """The session itself: connect, serve, clean up."""
+
+    def end(self):
+        """Stop the session and let its task clean up; safe to call from that task."""
+        self.active = False
+        if self.task and self.task is not asyncio.current_task():
+            self.task.cancel()
+
+    async def disconnect(self):
+        self.end()
+
+    def info(self):
+        return {
+            "session_id": self.session_id,
+            "mode": self.mode,
+            "channel_id": self.channel_id,
+            "active": self.running,
+        }
+
+class SessionManager:
+    """
+    Sessions running in this process, by session id: any number of hosts
+    and participants on different channels, up to MAX_SESSIONS, but one
+    per mode and channel.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.lock = Lock()
+
+    def prune(self):
+        for session_id, session in list(self.sessions.items()):
+            if not session.running:
+                del self.sessions[session_id]
+
+    def all(self):
+        self.prune()
+        return list(self.sessions.values())
+
+    def get(self, session_id):
+        self.prune()
+        return self.sessions.get(session_id)
+
+    def find(self, mode, channel_id):
+        return [
+            session for session in self.all()
+            if session.mode == mode and session.channel_id == channel_id
+        ]
+
+    async def start(self, session):
+        await session.prepare()
+        async with self.lock:
+            self.prune()
+            if session.session_id in self.sessions:
+                raise SessionError(f"Session {session.session_id} is already active")
+            if self.find(session.mode, session.channel_id):
+                raise SessionError(f"Already connected to {session.channel_id} in {session.mode} mode")
+            if len(self.sessions) >= self.max_sessions:
+                raise SessionError(f"Already running {self.max_sessions} sessions")
+            await session.start()
+            self.sessions[session.session_id] = session
+
+class HostSession(Session):
+    """
+    Streams this machine's audio to a channel's participants, with its own
+    capture, signaling connection and participant hub.
+    """
+    mode = "host"
+
+    def __init__(self, session_id, channel_id, frame_ms=FRAME_MS, workers=HOST_WORKERS, device=None):
+        super().__init__(session_id, channel_id)
+        self.frame_ms = frame_ms
+        self.workers = workers
+        self.hub = None  # ParticipantHub or WorkerPool
+        self.signaling = None
+        self.device = device
+        self.audio_capture = None
+        self.idle_task = None
+
+    async def disconnect(self):
+        # Participants closed from here on don't make the session wait for them
+        self.active = False
+        # Close all participant connections, a few at a time
+        forced = await self.hub.close_all() if self.hub else 0
+        if forced:
+            print(f"Force-closed {forced} participants after {TEARDOWN_TIMEOUT}s")
+        self.end()
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "channel_id": self.channel_id,
+            "device": self.device,
+            "signaling": self.signaling.stats() if self.signaling else None,
+            **(self.hub.stats() if self.hub else {"pool": None, "participants": {}}),
+        }
+
+    def end(self):
+        self.cancel_idle()
+        super().end()
+
+    def participant_left(self, participant_id):
+        if not self.hub.participants and self.active:
+            self.cancel_idle()
+            self.idle_task = asyncio.create_task(self.end_if_idle())
+
+    def cancel_idle(self):
+        if self.idle_task:
+            self.idle_task.cancel()
+            self.idle_task = None
+
+    async def end_if_idle(self):
+        """End the session unless a participant (re)joins within RESUME_GRACE."""
+        await asyncio.sleep(RESUME_GRACE)
+        self.idle_task = None
+        if not self.hub.participants and self.active:
+            self.end()
+
+    async def run(self):
         try:
-            if participant_key in data_channels:
-                channel = data_channels[participant_key]
-                if channel and channel.readyState != "closed":
-                    try:
-                        channel._data_channel._send_queued = []
-                        channel.close()
-                    except Exception as e:
-                        print(f"Error closing data channel: {e}")
-                    await asyncio.sleep(0.2)
-                data_channels.pop(participant_key, None)
-
-            if pc.connectionState != "closed":
-                for transceiver in pc.getTransceivers():
-                    if transceiver.sender:
-                        try:
-                            await transceiver.sender.replaceTrack(None)
-                        except:
-                            pass
-
+            self.device = self.device or get_default_monitor()
+            print(f"\nSelected DEVICE: {self.device}")
+            # Sessions on the same device share its capture
+            self.audio_capture = await captures.acquire(self.device, self.frame_ms)
+            # Participants run on this event loop, or spread over worker processes
+            if self.workers:
+                self.hub = WorkerPool(self.audio_capture, self.participant_left, self.workers).start()
+            else:
+                self.hub = ParticipantHub(self.audio_capture, self.participant_left).start()
+        
+            uri = SIGNALING_URI
+            self.signaling = Reconnector()
+            while self.active:
                 try:
-                    await pc.close()
-                    await asyncio.sleep(0.2)
+                    async with websockets.connect(uri) as ws:
+                        message = {
+                            "client": "host",
+                            "channel_id": self.channel_id,
+                            "type": "connection"
+                        }
+                        await ws.send(json.dumps(message))
+                        self.signaling.connected(self.hub.participants)
+                        self.hub.connected(ws)
+
+                        async for message in ws:
+                            # Check if connection is still active
+                            if not self.active:
+                                print("Connection no longer active, closing...")
+                                return
+
+                            data = json.loads(message)
+                            if data['type'] == 'send_offer':
+                                self.cancel_idle()
+                                self.hub.offer(ws, data)
+
+                            elif data['type'] == 'set_answer':
+                                await self.hub.answer(data)
+
+                            elif data['type'] == 'candidate':
+                                await self.hub.candidate(data)
+
                 except Exception as e:
-                    print(f"Error closing peer connection: {e}")
+                    print(f"Signaling connection lost: {e}")
 
-            participants.pop(participant_key, None)
-            print(f"Participant {participant_key} deleted successfully")
+                # Established participants keep streaming while signaling is down
+                if self.active:
+                    self.signaling.dropped(await self.hub.drop_unanswered())
+                    delay = self.signaling.delay()
+                    print(f"Reconnecting to signaling in {delay:.1f}s")
+                    await asyncio.sleep(delay)
 
+        except Exception as e:
+            print(f"Host connect error: {e}")
+            self.end()
         finally:
-            cleanup_locks.pop(participant_key, None)
-            
-    except Exception as e:
-        print(f"Error during participant deletion: {e}")
-        if participant_key in cleanup_locks:
-            cleanup_locks.pop(participant_key, None)
-
-def is_silence(pcm_data, threshold=500):
-    try:
-        audio_array = np.frombuffer(pcm_data, dtype=np.int16)
-        rms = np.sqrt(np.mean(np.square(audio_array.astype(np.float32))))
-        return rms < threshold
-    except Exception as e:
-        print(f"Error checking for silence: {e}")
-        return False
-
-async def stream_audio(participant_id, data_channel):
-    if participant_id not in data_channels:
-        print(f"Data channel for {participant_id} no longer exists")
-        return
-
-    process = None
-    try:
-        process = subprocess.Popen(
-            [
-                "parec",
-                "--device", DEVICE,
-                "--format=s16le",
-                "--rate", "48000",
-                "--channels", "2",
-                "--latency-msec=1",
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL,
-            bufsize=3840,
-        )
-        
-        while True:        
-            if (participant_id not in data_channels or 
-                data_channels[participant_id] != data_channel or 
-                data_channel.readyState != "open"):
-                print(f"Data channel for {participant_id} no longer available or not open")
-                break
-
-            try:
-                pcm_data = await asyncio.get_event_loop().run_in_executor(
-                    None, lambda: process.stdout.read(3840)
-                )
-                if not pcm_data:
-                    break
-                if is_silence(pcm_data):
-                    print("silence")
-                    continue
-                else:
-                    print("No silence")
-
-                if data_channel.readyState == "open":
-                    try:
-                        data_channel.send(pcm_data)
-                        del pcm_data
-                    except Exception as e:
-                        if "not connected" not in str(e):
-                            print(f"Error sending audio data: {e}")
-                        break
-                else:
-                    break
-                    
-                await asyncio.sleep(0)
-            except Exception as e:
-                if "not connected" not in str(e):
-                    print(f"Error streaming audio: {e}")
-                break
-    finally:
-        if process and process.poll() is None:
-            try:
-                process.terminate()
-                try:
-                    process.wait(timeout=1)
-                except subprocess.TimeoutExpired:
-                    process.kill()
-            except Exception as e:
-                print(f"Error cleaning up audio process: {e}")
-                
-        if participant_id in data_channels:
-            data_channels.pop(participant_id, None)
-
-async def host_connect(channel_id: str):
-    global DEVICE
-    try:
-        DEVICE = get_default_monitor()    
-        print(f"\nSelected DEVICE: {DEVICE}")
-        
-        uri = "wss://jam-ws-server.onrender.com/ws"
-        async with websockets.connect(uri) as ws:
-            message = {
-                "client": "host",
-                "channel_id": channel_id,
-                "type": "connection"
-            }
-            await ws.send(json.dumps(message))
-            
-            try:
-                async for message in ws:
-                    # Check if connection is still active
-                    if not current_server_mode or current_channel_id != channel_id:
-                        print("Connection no longer active, closing...")
-                        break
-                        
-                    data = json.loads(message)
-                    if data['type'] == 'send_offer':
-                        participant_id = data['participant_id']
-                        pc = RTCPeerConnection(rtc_config)
-                        
-                        participants[participant_id] = pc
-                        
-                        try:
-                            data_channel = pc.createDataChannel("audio")
-                            data_channels[participant_id] = data_channel
-
-                            @data_channel.on("open")
-                            def on_datachannel_open():
-                                print(f"Data channel opened for participant {participant_id}")
-                                asyncio.create_task(stream_audio(participant_id, data_channel))
-
-                            @data_channel.on("close")
-                            def on_datachannel_close():
-                                print(f"Data channel closed for participant {participant_id}")
-
-                            @pc.on("connectionstatechange")
-                            async def on_connectionstatechange():
-                                print(f"PeerConnection state changed to: {pc.connectionState}")
-                                if pc.connectionState in ["failed", "disconnected", "closed"]:
-                                    print(f"Connection {pc.connectionState}")
-                                    await delete_participant(pc)
-                                    if not participants:
-                                        await clear_server_mode()
-                            
-                            offer = await pc.createOffer()
-                            await pc.setLocalDescription(offer)
-                            await gather_complete(pc)
-                            
-                            message = {
-                                "client": "host",
-                                "type": "set_offer",
-                                "participant_id": participant_id,
-                                "sdp": pc.localDescription.sdp
-                            }
-                            await ws.send(json.dumps(message))
-                            
-                        except Exception as e:
-                            print(f"Error setting up connection: {e}")
-                            await delete_participant(pc)
-                            continue
-                    
-                    elif data['type'] == 'set_answer':
-                        try:
-                            answer = RTCSessionDescription(
-                                sdp=data["sdp"],
-                                type='answer'
-                            )
-                            participant_id = data['participant_id']
-                            if participant_id in participants:
-                                client_pc = participants[participant_id]
-                                await client_pc.setRemoteDescription(answer)
-                                print("Answer set successfully")
-                            else:
-                                print(f"Participant {participant_id} not found for answer")
-                        except Exception as e:
-                            print(f"Error setting remote description: {e}")
-                            
-            except Exception as e:
-                print(f"WebSocket error: {e}")
-                await clear_server_mode()
-                
-    except Exception as e:
-        print(f"Host connect error: {e}")
-        await clear_server_mode()
-    finally:
-        # Ensure cleanup happens
-        await clear_server_mode()
+            # Ensure cleanup happens
+            if self.hub:
+                await self.hub.close()
+            if self.audio_capture:
+                await captures.release(self.audio_capture)
+                self.audio_capture = None
+            self.end()
 
 # User-specific functions
 async def cleanup_connection(client_pc, audio_player, in_progress=False):
@@ -429,86 +382,198 @@ async def cleanup_connection(client_pc, audio_player, in_progress=False):
         if in_progress:
             setattr(client_pc, '_cleanup_in_progress', False)
 
-async def user_connect(channel_id: str):
-    audio_player = AudioPlayer()
-    uri = "wss://jam-ws-server.onrender.com/ws"
-    client_pc = None
-    participant_id = str(uuid.uuid4())
+class ParticipantSession(Session):
+    """Plays a channel's audio from its host through its own player."""
+    mode = "participant"
+
+    def __init__(self, session_id, channel_id):
+        super().__init__(session_id, channel_id)
+        self.player = None
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "channel_id": self.channel_id,
+            "playback": self.player.stats() if self.player else None,
+        }
+
+    async def run(self):
+        channel_id = self.channel_id
+        audio_player = self.player = AudioPlayer()
+        uri = SIGNALING_URI
+        client_pc = None
+        participant_id = str(uuid.uuid4())
     
-    try:
-        async with websockets.connect(uri) as ws:
-            client_pc = RTCPeerConnection(rtc_config)
-            
-            @client_pc.on("connectionstatechange")
-            async def on_connectionstatechange():
-                print(f"Connection state changed to: {client_pc.connectionState}")
-                if client_pc.connectionState in ["failed", "closed", "disconnected"]:
-                    await cleanup_connection(client_pc, audio_player, True)
-                    await clear_server_mode()
+        join_message = {
+            "client": "participant",
+            "type": "connection",
+            "channel_id": channel_id,
+            "participant_id": participant_id,
+            "codecs": SUPPORTED_CODECS,
+            "transports": SUPPORTED_TRANSPORTS,
+            "features": SUPPORTED_FEATURES + ICE_FEATURES
+        }
+        resume_deadline = None
+        resume_expiry = None
+        rejoins = None
+        leaving = False
+    
+        try:
+            async with websockets.connect(uri) as ws:
+                def open_peer_connection():
+                    nonlocal client_pc
+                    pc = client_pc = create_peer_connection()
+
+                    @pc.on("connectionstatechange")
+                    async def on_connectionstatechange():
+                        nonlocal resume_deadline, resume_expiry
+                        print(f"Connection state changed to: {pc.connectionState}")
+                        if pc.connectionState == "connected":
+                            resume_deadline = None
+                            if resume_expiry:
+                                resume_expiry.cancel()
+                                resume_expiry = None
+                        elif pc.connectionState in ["failed", "closed"]:
+                            await resume(pc)
+
+                    @pc.on("datachannel")
+                    def on_datachannel(channel):
+                        print(f"Data channel {channel.label} received")
+
+                        @channel.on("message")
+                        def on_message(message):
+                            try:
+                                if channel.readyState == "open":
+                                    audio_player.play(message)
+                                    del message
+                            except Exception as e:
+                                if "not connected" not in str(e):
+                                    print(f"Error handling audio message: {e}")
+
+                        @channel.on("close")
+                        def on_close():
+                            # The player is kept for a resumed connection
+                            print("Data channel closed")
+
+                    @pc.on("track")
+                    def on_track(track):
+                        print(f"Track {track.kind} received")
+                        if track.kind == "audio":
+                            asyncio.create_task(play_track(track, audio_player))
+
+                    return pc
+
+                def give_up():
+                    print("Could not resume the connection")
+                    self.end()
+
+                async def resume(pc):
+                    """
+                    Renegotiate a dropped connection over the signaling socket,
+                    keeping the socket and the player. Gives up after
+                    RESUME_GRACE seconds without getting back to "connected".
+                    """
+                    nonlocal resume_deadline, resume_expiry, rejoins
+                    if leaving or pc is not client_pc:
+                        return
+                    if resume_deadline is None:
+                        rejoins = Reconnector()
+                        loop = asyncio.get_running_loop()
+                        resume_deadline = loop.time() + RESUME_GRACE
+                        # The replacement may never change state again, so the deadline
+                        # can't wait for the next change to be checked
+                        resume_expiry = loop.call_at(resume_deadline, give_up)
+                    print("Connection lost, renegotiating")
+                    replacement = open_peer_connection()
+                    await cleanup_connection(pc, None)
+                    await asyncio.sleep(1)
+                    if leaving or not self.active or replacement is not client_pc:
+                        return
+                    try:
+                        await ws.send(json.dumps(join_message))
+                    except websockets.ConnectionClosed:
+                        pass  # the session is ending
+
+                open_peer_connection()
             
-            try:
-                message = {
-                    "client": "participant",
-                    "type": "connection",
-                    "channel_id": channel_id,
-                    "participant_id": participant_id
-                }
-                
-                await ws.send(json.dumps(message))
+                try:
+                    await ws.send(json.dumps(join_message))
                 
-                async for message in ws:
-                    # Check if connection is still active
-                    if not current_server_mode or current_channel_id != channel_id:
-                        print("Connection no longer active, closing...")
-                        break
+                    async for message in ws:
+                        # Check if connection is still active
+                        if not self.active:
+                            print("Connection no longer active, closing...")
+                            break
                         
-                    try:
-                        data = json.loads(message)
-                        if data['type'] == 'set_offer':
-                            offer = RTCSessionDescription(
-                                sdp=data["sdp"],
-                                type='offer'
-                            )
+                        try:
+                            data = json.loads(message)
+                            if data['type'] == 'set_offer':
+                                offer = RTCSessionDescription(
+                                    sdp=data["sdp"],
+                                    type='offer'
+                                )
+                                audio_player.configure(
+                                    data.get('codec', PCM),
+                                    data.get('sequenced', False),
+                                    data.get('frame_ms', 20),
+                                    data.get('marker_frames', 1),
+                                )
                             
-                            await client_pc.setRemoteDescription(offer)
-                            answer = await client_pc.createAnswer()
-                            await client_pc.setLocalDescription(answer)
-                            await gather_complete(client_pc)
+                                trickle = data.get('trickle', False)
+                                await client_pc.setRemoteDescription(offer)
+                                answer = await client_pc.createAnswer()
+                                pending = defer_server_candidates(client_pc) if trickle else []
+                                await client_pc.setLocalDescription(answer)
                             
-                            message = {
-                                'client': 'participant',
-                                'type': 'set_answer',
-                                'channel_id': channel_id,
-                                'participant_id': participant_id,
-                                "sdp": client_pc.localDescription.sdp
-                            }
-                            await ws.send(json.dumps(message))
+                                message = {
+                                    'client': 'participant',
+                                    'type': 'set_answer',
+                                    'channel_id': channel_id,
+                                    'participant_id': participant_id,
+                                    "sdp": local_sdp(client_pc, trickle)
+                                }
+                                await ws.send(json.dumps(message))
+                                if trickle:
+                                    asyncio.create_task(trickle_candidates(
+                                        pending, ws,
+                                        {"client": "participant", "channel_id": channel_id, "participant_id": participant_id},
+                                    ))
+
+                            elif data['type'] == 'candidate':
+                                await add_remote_candidate(client_pc, data)
                             
-                        elif data['type'] == 'not_found':
-                            print(f"Channel ID {channel_id} not found")
+                            elif data['type'] == 'not_found':
+                                print(f"Channel ID {channel_id} not found")
+                                if resume_deadline is not None:
+                                    # The host may be reconnecting to signaling after the same outage;
+                                    # ask again until the grace period runs out
+                                    await asyncio.sleep(rejoins.delay())
+                                    if resume_deadline is not None:
+                                        await ws.send(json.dumps(join_message))
                             
-                    except Exception as e:
-                        print(f"Error processing message: {e}")
-                        await cleanup_connection(client_pc, audio_player, True)
-                        break
+                        except Exception as e:
+                            print(f"Error processing message: {e}")
+                            await cleanup_connection(client_pc, audio_player, True)
+                            break
                 
-            except Exception as e:
-                print(f"WebSocket error: {e}")
-                await clear_server_mode()
+                except Exception as e:
+                    print(f"WebSocket error: {e}")
+                    self.end()
                 
-    except Exception as e:
-        print(f"User connect error: {e}")
-        await clear_server_mode()
-    finally:
-        await cleanup_connection(client_pc, audio_player, True)
-        await clear_server_mode()
+        except Exception as e:
+            print(f"User connect error: {e}")
+            self.end()
+        finally:
+            leaving = True
+            if resume_expiry:
+                resume_expiry.cancel()
+            await cleanup_connection(client_pc, audio_player, True)
+            self.end()
 
-# Utility functions
-async def gather_complete(pc):
-    await asyncio.sleep(0.1)
-    while pc.iceGatheringState != "complete":
-        await asyncio.sleep(0.1)
+sessions = SessionManager()
+captures = SharedCaptures()
 
+# Utility functions
 def get_default_monitor() -> str:
     output = subprocess.check_output(["pactl", "info"]).decode()
     for line in output.splitlines():
@@ -517,67 +582,6 @@ def get_default_monitor() -> str:
             return f"{default_sink}.monitor"
     raise RuntimeError("Default sink not found")
 
-# Audio player class
-class AudioPlayer:
-    def __init__(self, sample_rate=48000, channels=2):
-        self.sample_rate = sample_rate
-        self.channels = channels
-        self.process = None
-        self.start_process()
-
-    def start_process(self):
-        if self.process:
-            self.stop()
-        try:
-            self.process = subprocess.Popen(
-                [
-                    "paplay",
-                    "--rate", str(self.sample_rate),
-                    "--channels", str(self.channels),
-                    "--format=s16le",
-                    "--raw",
-                    "--latency-msec=1",
-                    "--process-time-msec=1"
-                ],
-                stdin=subprocess.PIPE,
-                bufsize=0,
-            )
-        except Exception as e:
-            print(f"Error starting audio process: {e}")
-            self.process = None
-
-    def play(self, audio_data):
-        try:
-            if self.process and self.process.poll() is None:
-                self.process.stdin.write(audio_data)
-                self.process.stdin.flush()
-                del audio_data
-            else:
-                self.start_process()
-        except BrokenPipeError:
-            self.stop()
-            self.start_process()
-        except Exception as e:
-            print(f"Error playing audio: {e}")
-            self.stop()
-                
-    def stop(self):
-        if self.process:
-            try:
-                if self.process.poll() is None:
-                    try:
-                        self.process.stdin.close()
-                    except:
-                        pass
-                    try:
-                        self.process.terminate()
-                        self.process.wait(timeout=1)
-                    except:
-                        self.process.kill()
-            except Exception as e:
-                print(f"Error stopping audio process: {e}")
-            self.process = None
-
 def main():
     # Run the FastAPI server
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,55 @@
+import struct
+import time
+from config import AUDIO_MAX_RETRANSMITS, AUDIO_MAX_PACKET_LIFE_TIME, DTX_MARKER_MS
+
+# Participants that understand the frame header below advertise this in
+# their connection message; everyone else gets bare payloads on a reliable,
+# ordered channel.
+SEQUENCED = "sequenced"
+SUPPORTED_FEATURES = [SEQUENCED]
+
+AUDIO = 0
+# "The next N frames, starting at seq, are silence"; payload is N
+SILENCE = 1
+
+# kind, sequence number, capture time in ms (both wrap at 32 bits)
+HEADER = struct.Struct("!BII")
+SILENCE_FRAMES = struct.Struct("!H")
+
+
+def capture_timestamp():
+    return int(time.monotonic() * 1000) & 0xFFFFFFFF
+
+
+def pack_frame(seq, timestamp, payload, kind=AUDIO):
+    return HEADER.pack(kind, seq & 0xFFFFFFFF, timestamp & 0xFFFFFFFF) + payload
+
+
+def pack_silence(seq, timestamp, frames):
+    return pack_frame(seq, timestamp, SILENCE_FRAMES.pack(frames), kind=SILENCE)
+
+
+def marker_frames(frame_ms, marker_ms=DTX_MARKER_MS):
+    """Silent frames a host collects before sending their marker."""
+    return max(1, int(marker_ms / frame_ms))
+
+
+def unpack_frame(message):
+    kind, seq, timestamp = HEADER.unpack_from(message)
+    return kind, seq, timestamp, message[HEADER.size:]
+
+
+def seq_diff(a, b):
+    """Signed distance from b to a, allowing for 32-bit wraparound."""
+    return ((a - b + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+def channel_options(sequenced):
+    """createDataChannel() options for the audio channel."""
+    if not sequenced:
+        return {}
+    # A late 20 ms frame is worse than none, so never wait on retransmits
+    if AUDIO_MAX_PACKET_LIFE_TIME is not None:
+        return {"ordered": False, "maxPacketLifeTime": AUDIO_MAX_PACKET_LIFE_TIME}
+    return {"ordered": False, "maxRetransmits": AUDIO_MAX_RETRANSMITS}
+
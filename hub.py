@@ -0,0 +1,298 @@
+import asyncio
+import json
+from contextlib import nullcontext
+from aiortc import RTCSessionDescription
+from certificate import create_peer_connection
+from codec import PCM, choose_codec
+from config import AUDIO_TRANSPORT, NEGOTIATION_CONCURRENCY, POOL_MAX_SIZE
+from framing import SEQUENCED, channel_options, marker_frames
+from ice import add_remote_candidate, can_trickle, defer_server_candidates, local_sdp, trickle_candidates
+from pool import PeerConnectionPool
+from registry import ParticipantRegistry, close_channel
+from rtp import DATA_CHANNEL, RTP, CaptureTrack, choose_transport
+from sender import AudioSender
+
+# Offers are prepared on the process's event loop, so the limit is shared by
+# every hub in it
+negotiation_slots = asyncio.Semaphore(NEGOTIATION_CONCURRENCY)
+
+
+class ParticipantHub:
+    """
+    The participants of one host session that live in this process: their
+    peer connections, negotiations and audio streams, all fed from one
+    capture. Signaling messages for them are handed in through offer(),
+    answer() and candidate(); `on_left(participant_id)` is called once a
+    participant is gone and hasn't rejoined under the same id.
+    """
+
+    def __init__(self, audio_capture, on_left=None):
+        self.audio_capture = audio_capture
+        self.on_left = on_left
+        self.participants = ParticipantRegistry()
+        self.negotiations = set()
+        self.connection_pool = None
+
+    def start(self):
+        if POOL_MAX_SIZE and self.connection_pool is None:
+            self.connection_pool = PeerConnectionPool(self.prepare_connection, True).start()
+        return self
+
+    def connected(self, ws):
+        """Signaling is (re)connected on `ws`; offers carry the socket they came in on."""
+
+    def offer(self, ws, data):
+        """Start negotiating with a joining participant; offers go out on `ws`."""
+        task = asyncio.create_task(self.negotiate_participant(ws, data))
+        self.negotiations.add(task)
+        task.add_done_callback(self.negotiations.discard)
+
+    async def answer(self, data):
+        try:
+            answer = RTCSessionDescription(
+                sdp=data["sdp"],
+                type='answer'
+            )
+            participant_id = data['participant_id']
+            if participant_id in self.participants:
+                client_pc = self.participants.get(participant_id).pc
+                await client_pc.setRemoteDescription(answer)
+                print("Answer set successfully")
+            else:
+                print(f"Participant {participant_id} not found for answer")
+        except Exception as e:
+            print(f"Error setting remote description: {e}")
+
+    async def candidate(self, data):
+        try:
+            if data['participant_id'] in self.participants:
+                await add_remote_candidate(self.participants.get(data['participant_id']).pc, data)
+        except Exception as e:
+            print(f"Error adding ICE candidate: {e}")
+
+    async def close_all(self):
+        """Close all participant connections, a few at a time. Returns how many were forced."""
+        return await self.participants.close_all(self.delete_participant)
+
+    async def close(self):
+        for task in list(self.negotiations):
+            task.cancel()
+        if self.connection_pool:
+            await self.connection_pool.close()
+            self.connection_pool = None
+
+    def stats(self):
+        return {
+            "pool": self.connection_pool.stats() if self.connection_pool else None,
+            "participants": {
+                participant.participant_id: participant.sender.stats()
+                for participant in self.participants.records()
+                if participant.sender
+            },
+        }
+
+    async def delete_participant(self, pc, notify=True):
+        try:
+            participant = self.participants.find(pc)
+            if not participant:
+                print("Participant already deleted")
+                return
+            participant_key = participant.participant_id
+
+            if participant.closing:
+                print(f"Cleanup already in progress for {participant_key}")
+                return
+
+            participant.closing = True
+            print(f"Starting cleanup for participant {participant_key}")
+
+            try:
+                channel = participant.channel
+                if channel:
+                    try:
+                        await close_channel(channel)
+                    except Exception as e:
+                        print(f"Error closing data channel: {e}")
+                participant.channel = None
+
+                if pc.connectionState != "closed":
+                    for transceiver in pc.getTransceivers():
+                        if transceiver.sender:
+                            try:
+                                if transceiver.sender.track:
+                                    transceiver.sender.track.stop()
+                                await transceiver.sender.replaceTrack(None)
+                            except:
+                                pass
+
+                    try:
+                        await pc.close()
+                    except Exception as e:
+                        print(f"Error closing peer connection: {e}")
+
+                self.participants.remove(participant)
+                print(f"Participant {participant_key} deleted successfully")
+
+            finally:
+                participant.closing = False
+
+            if notify and self.on_left and participant_key not in self.participants:
+                self.on_left(participant_key)
+
+        except Exception as e:
+            print(f"Error during participant deletion: {e}")
+
+    async def stream_audio(self, participant, codec=PCM, sequenced=False):
+        participant_id, data_channel = participant.participant_id, participant.channel
+        if not data_channel:
+            print(f"Data channel for {participant_id} no longer exists")
+            return
+
+        if not self.audio_capture or not self.audio_capture.running:
+            print(f"No audio capture running for {participant_id}")
+            return
+
+        cursor = self.audio_capture.subscribe(codec)
+        sender = AudioSender(data_channel, cursor, sequenced)
+        participant.sender = sender
+        try:
+            while True:
+                if participant.channel is not data_channel or data_channel.readyState != "open":
+                    print(f"Data channel for {participant_id} no longer available or not open")
+                    break
+
+                try:
+                    frame = await cursor.read()
+                    if not frame:
+                        break
+                    seq, timestamp, pcm_data, payload, voiced = frame
+
+                    if data_channel.readyState == "open":
+                        try:
+                            await sender.send(seq, timestamp, payload, voiced)
+                        except Exception as e:
+                            if "not connected" not in str(e):
+                                print(f"Error sending audio data: {e}")
+                            break
+                    else:
+                        break
+
+                    await asyncio.sleep(0)
+                except Exception as e:
+                    if "not connected" not in str(e):
+                        print(f"Error streaming audio: {e}")
+                    break
+        finally:
+            cursor.close()
+            participant.channel = None
+            participant.sender = None
+            participant.task = None
+
+    async def drop_unanswered(self):
+        """
+        Drop negotiations cut off by a lost signaling socket; their answers
+        will never arrive and the participants rejoin once their side gives up.
+        Returns the participants whose sessions are established and kept.
+        """
+        for task in list(self.negotiations):
+            task.cancel()
+        for participant in self.participants.records():
+            if participant.pc.connectionState == "new":
+                await self.delete_participant(participant.pc)
+        return list(self.participants)
+
+    async def prepare_connection(self, sequenced):
+        """A pooled peer connection: audio data channel created, offer gathered."""
+        pc = create_peer_connection()
+        try:
+            data_channel = pc.createDataChannel("audio", **channel_options(sequenced))
+            await pc.setLocalDescription(await pc.createOffer())
+        except BaseException:
+            await pc.close()
+            raise
+        return pc, data_channel
+
+    async def negotiate_participant(self, ws, data):
+        """
+        Create the peer connection for one joining participant and send it the
+        offer. Runs as its own task, so the signaling loop keeps reading answers
+        and further joins while offers are prepared; at most
+        NEGOTIATION_CONCURRENCY run at once. A connection taken from the pool
+        needs no slot and is offered immediately.
+        """
+        participant_id = data['participant_id']
+        codec = choose_codec(data.get('codecs'))
+        transport = choose_transport(data.get('transports'), AUDIO_TRANSPORT)
+        if transport == RTP:
+            codec = PCM
+        sequenced = transport == DATA_CHANNEL and SEQUENCED in (data.get('features') or [])
+        trickle = can_trickle(data.get('features'))
+        # Data channel connections can come from the pool, ready to offer
+        pooled = self.connection_pool.acquire(sequenced) if self.connection_pool and transport == DATA_CHANNEL else None
+
+        # A participant resuming after a dropped connection replaces its old one
+        if participant_id in self.participants:
+            await self.delete_participant(self.participants.get(participant_id).pc, notify=False)
+
+        async with (nullcontext() if pooled else negotiation_slots):
+            if pooled:
+                pc, data_channel = pooled
+            else:
+                pc = create_peer_connection()
+
+            participant = self.participants.add(participant_id, pc)
+
+            try:
+                if not pooled:
+                    if transport == RTP:
+                        pc.addTrack(CaptureTrack(self.audio_capture))
+                    data_channel = pc.createDataChannel("audio", **channel_options(sequenced))
+                participant.channel = data_channel
+
+                @data_channel.on("open")
+                def on_datachannel_open():
+                    print(f"Data channel opened for participant {participant_id}")
+                    if transport == DATA_CHANNEL:
+                        participant.task = asyncio.create_task(self.stream_audio(participant, codec, sequenced))
+
+                @data_channel.on("close")
+                def on_datachannel_close():
+                    print(f"Data channel closed for participant {participant_id}")
+
+                @pc.on("connectionstatechange")
+                async def on_connectionstatechange():
+                    print(f"PeerConnection state changed to: {pc.connectionState}")
+                    if pc.connectionState in ["failed", "closed"]:
+                        print(f"Connection {pc.connectionState}")
+                        await self.delete_participant(pc)
+
+                if pooled:
+                    # Candidates are gathered already; only the participant trickles
+                    sdp = local_sdp(pc, False)
+                else:
+                    offer = await pc.createOffer()
+                    pending = defer_server_candidates(pc) if trickle else []
+                    await pc.setLocalDescription(offer)
+                    sdp = local_sdp(pc, trickle)
+
+                message = {
+                    "client": "host",
+                    "type": "set_offer",
+                    "participant_id": participant_id,
+                    "codec": codec,
+                    "transport": transport,
+                    "sequenced": sequenced,
+                    "frame_ms": self.audio_capture.frame_ms,
+                    "marker_frames": marker_frames(self.audio_capture.frame_ms),
+                    "trickle": trickle,
+                    "sdp": sdp
+                }
+                await ws.send(json.dumps(message))
+                if trickle and not pooled:
+                    asyncio.create_task(trickle_candidates(
+                        pending, ws, {"client": "host", "participant_id": participant_id}
+                    ))
+
+            except Exception as e:
+                print(f"Error setting up connection: {e}")
+                await self.delete_participant(pc)
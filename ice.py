@@ -0,0 +1,124 @@
+import asyncio
+import ipaddress
+import json
+from aioice.ice import server_reflexive_candidate
+from aiortc import RTCConfiguration, RTCIceServer
+from aiortc.rtcicetransport import candidate_from_aioice
+from aiortc.sdp import candidate_from_sdp, candidate_to_sdp
+from config import ICE_TRICKLE, STUN_URLS, TURN_CREDENTIAL, TURN_URL, TURN_USERNAME
+
+# Peers that accept trickled "candidate" messages advertise this feature
+TRICKLE = "trickle"
+
+# How long to keep trickling server-reflexive candidates, in seconds
+TRICKLE_TIMEOUT = 5
+
+ice_servers = [RTCIceServer(urls=STUN_URLS)] if STUN_URLS else []
+if TURN_URL:
+    ice_servers.append(
+        RTCIceServer(urls=[TURN_URL], username=TURN_USERNAME, credential=TURN_CREDENTIAL)
+    )
+rtc_config = RTCConfiguration(iceServers=ice_servers)
+
+# aiortc can't add relay candidates after the fact, so with a TURN server
+# configured every description waits for the full gather instead
+TRICKLE_ENABLED = ICE_TRICKLE and not TURN_URL
+ICE_FEATURES = [TRICKLE] if TRICKLE_ENABLED else []
+
+
+def can_trickle(features):
+    return TRICKLE_ENABLED and TRICKLE in (features or [])
+
+
+def _gatherers(pc):
+    """
+    (media, RTCIceGatherer) for each transport of the peer connection. The
+    media is the SCTP transport or an RTP transceiver; its mid is only
+    assigned by setLocalDescription().
+    """
+    gatherers = []
+    if pc.sctp:
+        gatherers.append((pc.sctp, pc.sctp.transport.transport.iceGatherer))
+    for transceiver in pc.getTransceivers():
+        if transceiver.sender.transport:
+            gatherers.append((transceiver, transceiver.sender.transport.transport.iceGatherer))
+    return gatherers
+
+
+def defer_server_candidates(pc):
+    """
+    Limit the next setLocalDescription() to host candidates, which are
+    known immediately. Call after createOffer()/createAnswer(); returns what
+    trickle_candidates() needs to query the STUN server afterwards.
+    """
+    pending = []
+    for media, gatherer in _gatherers(pc):
+        connection = gatherer._connection
+        if gatherer.state == "new" and connection.stun_server:
+            pending.append((media, connection, connection.stun_server))
+            connection.stun_server = None
+    return pending
+
+
+def local_sdp(pc, trickle):
+    """The local description, left open for more candidates when trickling."""
+    sdp = pc.localDescription.sdp
+    if trickle:
+        sdp = "".join(
+            line for line in sdp.splitlines(keepends=True)
+            if not line.startswith("a=end-of-candidates")
+        )
+    return sdp
+
+
+async def trickle_candidates(pending, ws, message):
+    """
+    Ask the STUN server for each host socket's public address and send
+    every server-reflexive candidate over the signaling socket as soon as
+    it is known, followed by end-of-candidates. `message` holds the routing
+    fields of the "candidate" messages. An unreachable server only delays
+    the candidates it would have produced, never the offer or answer.
+    """
+    async def query(media, protocol, stun_server):
+        candidate, _ = await server_reflexive_candidate(protocol, stun_server)
+        return media.mid, candidate
+
+    tasks = [
+        asyncio.ensure_future(query(media, protocol, stun_server))
+        for media, connection, stun_server in pending
+        for protocol in list(connection._protocols)
+        if ipaddress.ip_address(protocol.local_candidate.host).version == 4
+    ]
+    try:
+        for future in asyncio.as_completed(tasks, timeout=TRICKLE_TIMEOUT):
+            try:
+                mid, candidate = await future
+            except asyncio.TimeoutError:
+                break
+            except Exception:
+                continue  # no reply from the STUN server for this socket
+            await ws.send(json.dumps({
+                **message,
+                "type": "candidate",
+                "candidate": "candidate:" + candidate_to_sdp(candidate_from_aioice(candidate)),
+                "sdpMid": mid,
+            }))
+        await ws.send(json.dumps({**message, "type": "candidate", "candidate": None}))
+    except Exception as e:
+        print(f"Error trickling ICE candidates: {e}")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def add_remote_candidate(pc, data):
+    """Apply a trickled "candidate" message to the peer connection."""
+    if not data.get("candidate"):
+        try:
+            await pc.addIceCandidate(None)
+        except Exception:
+            pass  # end-of-candidates is only a hint
+        return
+    candidate = candidate_from_sdp(data["candidate"].split(":", 1)[1])
+    candidate.sdpMid = data.get("sdpMid")
+    await pc.addIceCandidate(candidate)
@@ -0,0 +1,126 @@
+import math
+import time
+from framing import AUDIO, seq_diff
+
+# A missing frame is played as concealment rather than audio
+CONCEAL = 2
+
+
+class JitterBuffer:
+    """
+    Adaptive jitter buffer for sequenced frames.
+
+    Frames are stored by sequence number and released one per playout tick.
+    The target depth follows the RFC 3550 interarrival jitter estimate
+    (frame duration + 4 x jitter), so the buffer grows when the network
+    gets bursty and drops frames to shrink again once it calms down.
+    """
+
+    def __init__(self, frame_ms, min_delay_ms=None, max_delay_ms=500, marker_frames=1):
+        self.frame_ms = frame_ms
+        self.min_delay_ms = min_delay_ms if min_delay_ms is not None else 2 * frame_ms
+        # A silence marker arrives with the last frame it covers, so playout
+        # must run that far behind for the first one to be there in time
+        self.min_delay_ms = max(self.min_delay_ms, (marker_frames + 1) * frame_ms)
+        self.max_delay_ms = max_delay_ms
+        self.frames = {}
+        self.next_seq = None
+        self.highest_seq = None
+        self.playing = False
+        self.started = False
+        self.jitter = 0.0
+        self._last_transit = None
+        self.received = 0
+        self.late = 0
+        self.lost = 0
+        self.underruns = 0
+        self.accelerated = 0
+
+    @property
+    def target_frames(self):
+        target_ms = self.frame_ms + 4 * self.jitter
+        target_ms = min(max(target_ms, self.min_delay_ms), self.max_delay_ms)
+        return math.ceil(target_ms / self.frame_ms)
+
+    @property
+    def depth(self):
+        """Frames between the playout point and the newest frame received."""
+        if self.next_seq is None or not self.frames:
+            return 0
+        return max(0, seq_diff(self.highest_seq, self.next_seq) + 1)
+
+    def put(self, kind, seq, timestamp, payload, span=1, arrival=None):
+        arrival = time.monotonic() if arrival is None else arrival
+        self._update_jitter(timestamp, arrival)
+        self.received += 1
+
+        if self.next_seq is None:
+            self.next_seq = seq
+        if seq_diff(seq, self.next_seq) < 0:
+            self.late += 1
+            return
+
+        # Silence markers occupy one slot per frame they cover
+        for offset in range(span):
+            s = (seq + offset) & 0xFFFFFFFF
+            self.frames[s] = (kind, payload if kind == AUDIO else None)
+            if self.highest_seq is None or seq_diff(s, self.highest_seq) > 0:
+                self.highest_seq = s
+
+    def _update_jitter(self, timestamp, arrival):
+        transit = arrival * 1000 - timestamp
+        if self._last_transit is not None:
+            d = abs(transit - self._last_transit)
+            # Capture timestamps wrap at 32 bits
+            if d < 0x80000000:
+                self.jitter += (d - self.jitter) / 16
+        self._last_transit = transit
+
+    def pop(self):
+        """
+        Release the frame for the next playout tick as (kind, payload):
+        AUDIO with its payload, SILENCE, or CONCEAL for a gap. Returns None
+        until playout has started.
+        """
+        if not self.playing:
+            if self.next_seq is None or self.depth < self.target_frames:
+                # Refilling after an underrun: conceal without advancing,
+                # which stretches the delay up to the new target
+                return (CONCEAL, None) if self.started else None
+            self.playing = self.started = True
+
+        if not self.frames:
+            self.underruns += 1
+            self.playing = False
+            return CONCEAL, None
+
+        # Shrink toward the target by skipping a frame. Silence and gaps go
+        # first; audio is only cut when the buffer is far over target.
+        excess = self.depth - self.target_frames
+        if excess >= 2:
+            entry = self.frames.get(self.next_seq)
+            if entry is None or entry[0] != AUDIO or excess > self.target_frames:
+                self.frames.pop(self.next_seq, None)
+                self.next_seq = (self.next_seq + 1) & 0xFFFFFFFF
+                self.accelerated += 1
+                if entry is None:
+                    self.lost += 1
+
+        entry = self.frames.pop(self.next_seq, None)
+        self.next_seq = (self.next_seq + 1) & 0xFFFFFFFF
+        if entry is None:
+            self.lost += 1
+            return CONCEAL, None
+        return entry
+
+    def stats(self):
+        return {
+            "depth_ms": self.depth * self.frame_ms,
+            "target_ms": self.target_frames * self.frame_ms,
+            "jitter_ms": round(self.jitter, 2),
+            "received": self.received,
+            "late": self.late,
+            "lost": self.lost,
+            "underruns": self.underruns,
+            "accelerated": self.accelerated,
+        }
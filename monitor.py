@@ -0,0 +1,50 @@
+import asyncio
+
+
+class LoopLagMonitor:
+    """
+    Measures event-loop lag: how late a task that sleeps for a fixed
+    interval is woken up. Anything that blocks the loop, such as a stalled
+    pipe write or a long decode, shows up here.
+    """
+
+    def __init__(self, interval_ms=50, stall_ms=20):
+        self.interval = interval_ms / 1000
+        self.stall = stall_ms / 1000
+        self.task = None
+        self.last = 0.0
+        self.max = 0.0
+        self.total = 0.0
+        self.samples = 0
+        self.stalls = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.last = lag
+            self.max = max(self.max, lag)
+            self.total += lag
+            self.samples += 1
+            if lag >= self.stall:
+                self.stalls += 1
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def stats(self):
+        return {
+            "lag_ms": round(self.last * 1000, 2),
+            "lag_avg_ms": round(self.total / self.samples * 1000, 2) if self.samples else 0.0,
+            "lag_max_ms": round(self.max * 1000, 2),
+            "stalls": self.stalls,
+        }
@@ -0,0 +1,318 @@
+import asyncio
+import fcntl
+import math
+import subprocess
+import threading
+import time
+from collections import deque
+import numpy as np
+from codec import PCM, OPUS, OpusDecoder, frame_bytes
+from config import (
+    COMFORT_NOISE_LEVEL, JITTER_MAX_DELAY_MS, JITTER_MIN_DELAY_MS, PLAYBACK_QUEUE_MS
+)
+from drift import DriftEstimator, Resampler
+from framing import AUDIO, SILENCE, SILENCE_FRAMES, unpack_frame
+from jitter import CONCEAL, JitterBuffer
+from plc import LossConcealer
+
+
+class PlaybackWriter:
+    """
+    Owns one paplay process on a dedicated thread. The event loop hands
+    frames over through a bounded queue and never waits on the pipe, so a
+    stalled audio device can't hold up SCTP, signaling or the playout
+    clock. When the queue is full the oldest frame is dropped.
+
+    There is exactly one producer (the event loop) and one consumer (the
+    writer thread); deque appends and pops are atomic, so no lock is needed.
+
+    The pipe to paplay is kept as small as the kernel allows, so each write
+    returns at the pace paplay plays it. wait_for_room() lets the playout
+    clock follow the sound card rather than the system clock.
+    """
+
+    # Seconds to wait before trying to start paplay again after a failure
+    RETRY_INTERVAL = 1.0
+
+    def __init__(self, command, capacity, bytes_per_second):
+        self.command = command
+        self.capacity = capacity
+        self.bytes_per_second = bytes_per_second
+        self.queue = deque()
+        self.overruns = 0
+        self.written = 0
+        self.written_bytes = 0
+        self.closed = False
+        self.loop = None
+        self._room = asyncio.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="paplay-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, audio_data):
+        if self.closed:
+            return
+        if len(self.queue) >= self.capacity:
+            try:
+                self.queue.popleft()
+                self.overruns += 1
+            except IndexError:
+                pass
+        self.queue.append(audio_data)
+        self._wake.set()
+
+    async def wait_for_room(self, limit, timeout):
+        """Wait until fewer than `limit` frames are queued, or `timeout` s."""
+        self.loop = asyncio.get_running_loop()
+        while True:
+            self._room.clear()
+            if len(self.queue) < limit or self.closed:
+                return
+            try:
+                await asyncio.wait_for(self._room.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
+
+    def close(self):
+        """Stop the writer; the thread shuts paplay down on its own."""
+        self.closed = True
+        self._wake.set()
+
+    def _notify(self):
+        if self.loop:
+            try:
+                self.loop.call_soon_threadsafe(self._room.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def _spawn(self):
+        try:
+            process = subprocess.Popen(self.command, stdin=subprocess.PIPE, bufsize=0)
+        except Exception as e:
+            print(f"Error starting audio process: {e}")
+            return None
+        set_pipe_size = getattr(fcntl, "F_SETPIPE_SZ", None)
+        if set_pipe_size:
+            try:
+                fcntl.fcntl(process.stdin.fileno(), set_pipe_size, 4096)
+            except OSError:
+                pass
+        return process
+
+    def _run(self):
+        process = None
+        failed_at = None
+        while not self.closed:
+            self._wake.wait()
+            self._wake.clear()
+            while self.queue and not self.closed:
+                audio_data = self.queue.popleft()
+                if process is None or process.poll() is not None:
+                    process = None
+                    if not failed_at or time.monotonic() - failed_at >= self.RETRY_INTERVAL:
+                        process = self._spawn()
+                        failed_at = None if process else time.monotonic()
+                    if process is None:
+                        # No device: discard at playback speed so the
+                        # playout clock keeps real time
+                        time.sleep(len(audio_data) / self.bytes_per_second)
+                        self._notify()
+                        continue
+                try:
+                    process.stdin.write(audio_data)
+                    self.written += 1
+                    self.written_bytes += len(audio_data)
+                except BrokenPipeError:
+                    self._terminate(process)
+                    process = None
+                except Exception as e:
+                    print(f"Error playing audio: {e}")
+                    self._terminate(process)
+                    process = None
+                self._notify()
+        self.queue.clear()
+        if process:
+            self._terminate(process)
+
+    @staticmethod
+    def _terminate(process):
+        try:
+            if process.poll() is None:
+                try:
+                    process.stdin.close()
+                except:
+                    pass
+                try:
+                    process.terminate()
+                    process.wait(timeout=1)
+                except:
+                    process.kill()
+        except Exception as e:
+            print(f"Error stopping audio process: {e}")
+
+    def stats(self):
+        return {
+            "queued_frames": len(self.queue),
+            "written": self.written,
+            "overruns": self.overruns,
+        }
+
+
+class AudioPlayer:
+    """
+    Plays received audio through paplay. Sequenced streams go through an
+    adaptive jitter buffer and are released one frame at a time as paplay
+    makes room, then resampled by a fraction of a percent to absorb clock
+    drift between the host and this machine. Legacy streams are written as
+    they arrive. Either way the actual pipe writes happen on a
+    PlaybackWriter thread.
+    """
+
+    # Frames queued for the writer before the playout clock waits
+    WRITER_DEPTH = 2
+
+    def __init__(self, sample_rate=48000, channels=2, codec=PCM, sequenced=False, frame_ms=20):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.writer = None
+        self.decoder = None
+        self.jitter = None
+        self.concealer = None
+        self.drift = None
+        self.resampler = None
+        self.playout_task = None
+        self.frame_ms = frame_ms
+        self.silence = b""
+        self.configure(codec, sequenced, frame_ms)
+        self.start_process()
+
+    def configure(self, codec=PCM, sequenced=False, frame_ms=20, marker_frames=1):
+        """Set the wire format of incoming messages, as negotiated via set_offer."""
+        self.codec = codec
+        if codec == OPUS:
+            self.decoder = OpusDecoder(self.sample_rate, self.channels)
+        else:
+            self.decoder = None
+        self.stop_playout()
+        self.jitter = JitterBuffer(
+            frame_ms, JITTER_MIN_DELAY_MS, JITTER_MAX_DELAY_MS, marker_frames
+        ) if sequenced else None
+
+        restart = self.writer and frame_ms != self.frame_ms
+        self.frame_ms = frame_ms
+        self.frame_bytes = frame_bytes(frame_ms)
+        frame_samples = self.frame_bytes // (2 * self.channels)
+        if sequenced:
+            self.concealer = LossConcealer(frame_samples, self.channels)
+            self.drift = DriftEstimator(frame_samples, self.sample_rate)
+            self.resampler = Resampler(frame_samples, self.channels)
+        else:
+            self.concealer = self.drift = self.resampler = None
+        if restart:
+            # paplay's buffering follows the frame duration
+            self.start_process()
+
+    def start_process(self):
+        if self.writer:
+            self.stop_process()
+        self.writer = PlaybackWriter(
+            [
+                "paplay",
+                "--rate", str(self.sample_rate),
+                "--channels", str(self.channels),
+                "--format=s16le",
+                "--raw",
+                f"--latency-msec={max(1, math.ceil(self.frame_ms))}",
+                f"--process-time-msec={max(1, math.ceil(self.frame_ms / 2))}",
+            ],
+            max(2, math.ceil(PLAYBACK_QUEUE_MS / self.frame_ms)),
+            self.sample_rate * self.channels * 2,
+        )
+
+    def play(self, message):
+        """Play one data channel message in the negotiated wire format."""
+        if not self.jitter:
+            self.write(self.decoder.decode(message) if self.decoder else message)
+            return
+
+        kind, seq, timestamp, payload = unpack_frame(message)
+        if kind == AUDIO:
+            span = 1
+        elif kind == SILENCE:
+            span = SILENCE_FRAMES.unpack(payload)[0]
+        else:
+            return
+
+        self.jitter.put(kind, seq, timestamp, payload, span)
+        self.drift.arrived(time.monotonic(), seq)
+        if self.playout_task is None:
+            self.playout_task = asyncio.get_running_loop().create_task(self._playout())
+
+    async def _playout(self):
+        """Release frames from the jitter buffer as paplay consumes them."""
+        interval = self.frame_ms / 1000
+        while self.jitter:
+            if not self.writer:
+                self.start_process()
+            writer = self.writer
+            await writer.wait_for_room(self.WRITER_DEPTH, 4 * interval)
+            self.drift.consumed(time.monotonic(), writer.written_bytes // (2 * self.channels))
+            ratio = self.drift.update(self.jitter.depth, self.jitter.target_frames)
+            frame = self.jitter.pop()
+            if not frame:
+                # Still prebuffering
+                await asyncio.sleep(interval)
+                continue
+            self.write(self.resampler.process(self.render(*frame), ratio))
+
+    def render(self, kind, payload):
+        """PCM for one frame released by the jitter buffer."""
+        if kind == AUDIO:
+            pcm_data = self.decoder.decode(payload) if self.decoder else payload
+            return self.concealer.update(pcm_data)
+        if kind == CONCEAL:
+            return self.concealer.conceal()
+        self.concealer.reset()
+        return self.comfort_noise()
+
+    def stats(self):
+        """Writer queue state, plus the jitter buffer's for sequenced streams."""
+        stats = self.writer.stats() if self.writer else {}
+        if self.jitter:
+            stats.update(self.jitter.stats())
+            stats["concealed"] = self.concealer.concealed
+            stats.update(self.drift.stats())
+        return stats
+
+    def comfort_noise(self):
+        """One frame of DTX silence: zeros or low-level comfort noise."""
+        if len(self.silence) != self.frame_bytes:
+            if COMFORT_NOISE_LEVEL:
+                noise = np.random.randint(
+                    -COMFORT_NOISE_LEVEL, COMFORT_NOISE_LEVEL + 1,
+                    self.frame_bytes // 2, dtype=np.int16,
+                )
+                self.silence = noise.tobytes()
+            else:
+                self.silence = bytes(self.frame_bytes)
+        return self.silence
+
+    def write(self, audio_data):
+        """Queue s16le PCM for paplay without blocking."""
+        if not self.writer:
+            self.start_process()
+        self.writer.put(audio_data)
+
+    def stop_playout(self):
+        if self.playout_task:
+            self.playout_task.cancel()
+            self.playout_task = None
+
+    def stop(self):
+        self.stop_playout()
+        self.stop_process()
+
+    def stop_process(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,147 @@
+import numpy as np
+from codec import CHANNELS, SAMPLE_RATE
+from config import PLC_FADE_MS, PLC_MODE
+
+# Repeat the last frame, fading out
+REPEAT = "repeat"
+# Extend the last pitch period found by waveform similarity, fading out
+WSOLA = "wsola"
+PLC_MODES = (REPEAT, WSOLA)
+
+# Pitch search range and match window, in samples (2.5-15 ms, 5 ms)
+MIN_PERIOD = SAMPLE_RATE // 400
+MAX_PERIOD = SAMPLE_RATE * 15 // 1000
+TEMPLATE = SAMPLE_RATE * 5 // 1000
+# The search runs on a decimated mono mix
+DECIMATE = 4
+# Crossfade from concealment back into real audio
+OVERLAP = SAMPLE_RATE // 400
+
+
+class LossConcealer:
+    """
+    Synthesizes s16le frames for gaps the jitter buffer couldn't fill.
+
+    Every good frame is copied into a short history. For a gap, the last
+    period of that history (a whole frame in "repeat" mode, or the pitch
+    period that best matches the most recent audio in "wsola" mode) is
+    extended for as long as the loss lasts, fading to silence over
+    PLC_FADE_MS. The first frame after a gap is overlap-added with the
+    concealment's continuation so playback resumes without a click.
+
+    All work buffers are allocated up front; concealing a frame is a few
+    vectorized passes over it.
+    """
+
+    def __init__(self, frame_samples, channels=CHANNELS, mode=PLC_MODE,
+                 fade_ms=PLC_FADE_MS, sample_rate=SAMPLE_RATE):
+        if mode not in PLC_MODES:
+            raise ValueError(f"Unknown PLC mode {mode}, use one of {PLC_MODES}")
+        self.frame_samples = frame_samples
+        self.channels = channels
+        self.mode = mode
+        self.history = np.zeros(
+            (max(frame_samples, MAX_PERIOD + TEMPLATE), channels), dtype=np.int16
+        )
+        self.overlap = min(OVERLAP, frame_samples)
+        n = frame_samples + self.overlap
+
+        self.synth = np.empty((n, channels), dtype=np.int16)
+        self.gains = np.empty((n, 1), dtype=np.float32)
+        self.out = np.empty((n, channels), dtype=np.float32)
+        self.result = np.empty((frame_samples, channels), dtype=np.int16)
+        self.recovered = np.empty((frame_samples, channels), dtype=np.int16)
+        self.mix = np.empty((self.overlap, channels), dtype=np.float32)
+        self.fade_in = (
+            np.arange(1, self.overlap + 1, dtype=np.float32) / (self.overlap + 1)
+        )[:, None]
+        self.fade_step = 1 / max(1, fade_ms * sample_rate / 1000)
+        self.decay = np.arange(n, dtype=np.float32)[:, None] * self.fade_step
+
+        m = len(self.history[::DECIMATE])
+        self.mono = np.empty(m, dtype=np.float32)
+        self.squares = np.empty(m, dtype=np.float32)
+        self.energy = np.zeros(m + 1, dtype=np.float64)
+        self.lags = np.arange(MIN_PERIOD // DECIMATE, MAX_PERIOD // DECIMATE + 1)
+        # Start of the window `lag` samples before the match template
+        self.starts = m - TEMPLATE // DECIMATE - self.lags
+
+        self.lost = 0  # consecutive frames concealed so far
+        self.concealed = 0
+        self.gain = 1.0
+        self.period = frame_samples
+        self.phase = 0
+
+    def reset(self):
+        """Forget the history, e.g. after DTX silence."""
+        self.history.fill(0)
+        self.lost = 0
+
+    def update(self, pcm_data):
+        """Record a good frame. Returns it, smoothed if it ends a gap."""
+        frame = np.frombuffer(pcm_data, dtype=np.int16).reshape(-1, self.channels)
+        if self.lost and len(frame) == self.frame_samples:
+            np.copyto(self.recovered, frame)
+            head = self.recovered[:self.overlap]
+            # head * fade_in + tail * (1 - fade_in)
+            np.subtract(head, self.out[self.frame_samples:], out=self.mix)
+            self.mix *= self.fade_in
+            self.mix += self.out[self.frame_samples:]
+            np.copyto(head, self.mix, casting="unsafe")
+            frame = self.recovered
+            pcm_data = frame.tobytes()
+        self.lost = 0
+
+        n = len(frame)
+        if n >= len(self.history):
+            self.history[:] = frame[-len(self.history):]
+        else:
+            self.history[:-n] = self.history[n:]
+            self.history[-n:] = frame
+        return pcm_data
+
+    def conceal(self):
+        """Return a synthetic frame for the next missing sequence number."""
+        if self.lost == 0:
+            self.period = self._find_period() if self.mode == WSOLA else self.frame_samples
+            self.phase = 0
+            self.gain = 1.0
+        self.lost += 1
+        self.concealed += 1
+
+        # Periodic extension of the last `period` samples of history
+        segment = self.history[len(self.history) - self.period:]
+        pos, start = 0, self.phase
+        while pos < len(self.synth):
+            count = min(self.period - start, len(self.synth) - pos)
+            self.synth[pos:pos + count] = segment[start:start + count]
+            pos += count
+            start = 0
+
+        np.subtract(self.gain, self.decay, out=self.gains)
+        np.maximum(self.gains, 0, out=self.gains)
+        np.multiply(self.synth, self.gains, out=self.out)
+        np.copyto(self.result, self.out[:self.frame_samples], casting="unsafe")
+
+        self.phase = (self.phase + self.frame_samples) % self.period
+        self.gain = max(0.0, self.gain - self.fade_step * self.frame_samples)
+        return self.result.tobytes()
+
+    def _find_period(self):
+        """Lag whose waveform best matches the most recent audio."""
+        decimated = self.history[::DECIMATE]
+        if self.channels == 2:
+            np.add(decimated[:, 0], decimated[:, 1], out=self.mono)
+        else:
+            np.copyto(self.mono, decimated[:, 0])
+
+        size = TEMPLATE // DECIMATE
+        corr = np.correlate(self.mono[:-1], self.mono[-size:])
+        # Sliding window energy from a running sum of squares
+        np.multiply(self.mono, self.mono, out=self.squares)
+        np.cumsum(self.squares, dtype=np.float64, out=self.energy[1:])
+        energy = self.energy[self.starts + size] - self.energy[self.starts]
+        if not energy.any():
+            return min(self.frame_samples, len(self.history))
+        score = corr[self.starts] / np.sqrt(np.maximum(energy, 0) + 1e-9)
+        return int(self.lags[np.argmax(score)]) * DECIMATE
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from collections import deque
+from config import POOL_MAX_AGE, POOL_MAX_SIZE, POOL_MIN_SIZE
+
+# Joins counted when sizing the pool, in seconds
+RATE_WINDOW = 60
+# Pause after a failed prepare before trying again, in seconds
+RETRY_INTERVAL = 1.0
+
+
+class PeerConnectionPool:
+    """
+    Peer connections prepared ahead of joins: data channel created, offer
+    set and candidates gathered, so a joining participant can be sent an
+    offer straight away. Connections are pooled per profile (whatever
+    `prepare` needs to know to build one) and replaced in the background,
+    one at a time, after every join.
+
+    Each profile keeps as many connections as it saw joins in the last
+    minute, between POOL_MIN_SIZE (for the default profile only) and
+    POOL_MAX_SIZE. Connections older than POOL_MAX_AGE seconds are
+    replaced, as the NAT bindings behind their server-reflexive candidates
+    may have timed out.
+    """
+
+    def __init__(self, prepare, default_profile, min_size=POOL_MIN_SIZE,
+                 max_size=POOL_MAX_SIZE, max_age=POOL_MAX_AGE):
+        self.prepare = prepare  # async profile -> (pc, data_channel)
+        self.default_profile = default_profile
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self.ready = {default_profile: deque()}  # profile -> (created, pc, data_channel)
+        self.joins = {}  # profile -> join times
+        self.hits = 0
+        self.misses = 0
+        self.task = None
+        self._wake = asyncio.Event()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def acquire(self, profile):
+        """A prepared (pc, data_channel) for `profile`, or None if none is ready."""
+        now = time.monotonic()
+        self.joins.setdefault(profile, deque()).append(now)
+        self._wake.set()
+        ready = self.ready.setdefault(profile, deque())
+        while ready:
+            created, pc, data_channel = ready.popleft()
+            if now - created < self.max_age and pc.connectionState == "new":
+                self.hits += 1
+                return pc, data_channel
+            self._discard(pc)
+        self.misses += 1
+        return None
+
+    def target(self, profile, now):
+        joins = self.joins.get(profile)
+        while joins and now - joins[0] > RATE_WINDOW:
+            joins.popleft()
+        floor = self.min_size if profile == self.default_profile else 0
+        return min(self.max_size, max(floor, len(joins or ())))
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            deficits = {}
+            for profile, ready in self.ready.items():
+                while ready and now - ready[0][0] >= self.max_age:
+                    self._discard(ready.popleft()[1])
+                target = self.target(profile, now)
+                while len(ready) > target:
+                    self._discard(ready.pop()[1])
+                deficits[profile] = target - len(ready)
+
+            profile = max(deficits, key=deficits.get)
+            if deficits[profile] > 0:
+                try:
+                    pc, data_channel = await self.prepare(profile)
+                except Exception as e:
+                    print(f"Error preparing pooled connection: {e}")
+                    await asyncio.sleep(RETRY_INTERVAL)
+                    continue
+                self.ready[profile].append((time.monotonic(), pc, data_channel))
+                continue
+
+            # Full: sleep until the next join or the oldest entry expires
+            self._wake.clear()
+            oldest = min((ready[0][0] for ready in self.ready.values() if ready), default=None)
+            timeout = oldest + self.max_age - now if oldest is not None else RATE_WINDOW
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(timeout, 0.1))
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _discard(pc):
+        asyncio.ensure_future(pc.close())
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        for ready in self.ready.values():
+            while ready:
+                await ready.popleft()[1].close()
+
+    def stats(self):
+        return {
+            "ready": sum(len(ready) for ready in self.ready.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
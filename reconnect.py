@@ -0,0 +1,56 @@
+import random
+import time
+from config import SIGNALING_RECONNECT_MAX
+
+# Upper bound of the first retry delay, in seconds
+INITIAL_DELAY = 0.5
+
+
+class Reconnector:
+    """
+    Exponential backoff with full jitter for the signaling socket, so hosts
+    cut off by the same server restart don't all come back at once. Also
+    keeps what reconnects cost: how long signaling was down and how many
+    established sessions lived through it.
+    """
+
+    def __init__(self, initial=INITIAL_DELAY, maximum=SIGNALING_RECONNECT_MAX):
+        self.initial = initial
+        self.maximum = maximum
+        self.attempt = 0
+        self.dropped_at = None
+        self.sessions = set()
+        self.reconnects = 0
+        self.last_downtime = 0.0
+        self.sessions_kept = 0
+
+    def dropped(self, sessions):
+        """The socket was lost while `sessions` were established."""
+        if self.dropped_at is None:
+            self.dropped_at = time.monotonic()
+            self.sessions = set(sessions)
+
+    def delay(self):
+        """Seconds to wait before the next attempt."""
+        cap = min(self.maximum, self.initial * 2 ** self.attempt)
+        self.attempt += 1
+        return random.uniform(0, cap)
+
+    def connected(self, sessions):
+        """Registered again; `sessions` are the ones established now."""
+        self.attempt = 0
+        if self.dropped_at is None:
+            return
+        self.reconnects += 1
+        self.last_downtime = time.monotonic() - self.dropped_at
+        self.sessions_kept += len(self.sessions & set(sessions))
+        self.dropped_at = None
+        self.sessions = set()
+
+    def stats(self):
+        return {
+            "connected": self.dropped_at is None,
+            "reconnects": self.reconnects,
+            "last_downtime_ms": round(self.last_downtime * 1000, 1),
+            "sessions_kept": self.sessions_kept,
+        }
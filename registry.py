@@ -0,0 +1,108 @@
+import asyncio
+from config import TEARDOWN_CONCURRENCY, TEARDOWN_TIMEOUT
+
+# Longest wait for the peer to acknowledge a closed data channel, in seconds
+CHANNEL_CLOSE_TIMEOUT = 0.5
+
+
+async def close_channel(channel, timeout=CHANNEL_CLOSE_TIMEOUT):
+    """Close a data channel and wait for its "close" event, at most `timeout`."""
+    if channel.readyState == "closed":
+        return
+    closed = asyncio.get_running_loop().create_future()
+
+    def on_close():
+        if not closed.done():
+            closed.set_result(None)
+
+    channel.on("close", on_close)
+    try:
+        channel.close()
+        await asyncio.wait_for(closed, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        channel.remove_listener("close", on_close)
+
+
+class Participant:
+    """A listener's host-side state: its connection, audio channel and sender."""
+
+    __slots__ = ("participant_id", "pc", "channel", "sender", "task", "closing")
+
+    def __init__(self, participant_id, pc):
+        self.participant_id = participant_id
+        self.pc = pc
+        self.channel = None
+        self.sender = None  # AudioSender while streaming, holds its counters
+        self.task = None  # the stream_audio task
+        self.closing = False
+
+
+class ParticipantRegistry:
+    """
+    The host's participants, indexed both by participant id and by peer
+    connection, so connection events find their participant without a
+    scan. Iterating yields participant ids.
+    """
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_pc = {}
+
+    def add(self, participant_id, pc):
+        participant = Participant(participant_id, pc)
+        self._by_id[participant_id] = participant
+        self._by_pc[pc] = participant
+        return participant
+
+    def get(self, participant_id):
+        return self._by_id.get(participant_id)
+
+    def find(self, pc):
+        return self._by_pc.get(pc)
+
+    def remove(self, participant):
+        # A resumed participant may already be registered again under its id
+        if self._by_id.get(participant.participant_id) is participant:
+            del self._by_id[participant.participant_id]
+        self._by_pc.pop(participant.pc, None)
+
+    async def close_all(self, delete, concurrency=TEARDOWN_CONCURRENCY, timeout=TEARDOWN_TIMEOUT):
+        """
+        Run `delete` (a coroutine taking a peer connection) for every
+        participant, `concurrency` at a time. Participants still registered
+        after `timeout` seconds are dropped and their connections left to
+        close in the background. Returns how many were dropped that way.
+        """
+        slots = asyncio.Semaphore(concurrency)
+
+        async def close(participant):
+            async with slots:
+                await delete(participant.pc)
+
+        records = self.records()
+        if not records:
+            return 0
+        tasks = [asyncio.ensure_future(close(participant)) for participant in records]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+        stragglers = [participant for participant in records if self.find(participant.pc) is participant]
+        for participant in stragglers:
+            self.remove(participant)
+            asyncio.ensure_future(participant.pc.close())
+        return len(stragglers)
+
+    def records(self):
+        return list(self._by_id.values())
+
+    def __contains__(self, participant_id):
+        return participant_id in self._by_id
+
+    def __iter__(self):
+        return iter(list(self._by_id))
+
+    def __len__(self):
+        return len(self._by_id)
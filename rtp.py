@@ -0,0 +1,76 @@
+import asyncio
+from fractions import Fraction
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+from codec import SAMPLE_RATE, CHANNELS, PcmConverter, frame_bytes, pcm_to_frame
+
+DATA_CHANNEL = "datachannel"
+RTP = "rtp"
+
+# Peers that don't advertise anything only know the data channel
+SUPPORTED_TRANSPORTS = [DATA_CHANNEL, RTP]
+
+# aiortc's Opus encoder always packetizes 20 ms of audio
+RTP_FRAME_BYTES = frame_bytes(20)
+
+
+def choose_transport(offered, preferred):
+    """Use the host's preferred transport if the participant supports it."""
+    offered = offered or [DATA_CHANNEL]
+    return preferred if preferred in offered else DATA_CHANNEL
+
+
+class CaptureTrack(MediaStreamTrack):
+    """
+    Audio track fed from the shared AudioCapture. aiortc encodes it and
+    sends it over SRTP, so loss and jitter are handled by the RTP stack
+    instead of the reliable data channel. Capture frames are regrouped into
+    the 20 ms frames aiortc expects, whatever the session frame duration.
+    """
+
+    kind = "audio"
+
+    def __init__(self, capture):
+        super().__init__()
+        self.cursor = capture.subscribe()
+        self.time_base = Fraction(1, SAMPLE_RATE)
+        self.pts = 0
+        self.buffer = bytearray()
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+
+        while len(self.buffer) < RTP_FRAME_BYTES:
+            frame = await self.cursor.read()
+            if not frame:
+                self.stop()
+                raise MediaStreamError
+            self.buffer += frame[2]
+
+        # pcm_to_frame copies the samples, so a view of the buffer is enough
+        with memoryview(self.buffer)[:RTP_FRAME_BYTES] as pcm_data:
+            audio_frame = pcm_to_frame(pcm_data, self.pts, SAMPLE_RATE, CHANNELS)
+        del self.buffer[:RTP_FRAME_BYTES]
+        audio_frame.time_base = self.time_base
+        self.pts += audio_frame.samples
+        return audio_frame
+
+    def stop(self):
+        self.cursor.close()
+        super().stop()
+
+
+async def play_track(track, audio_player):
+    """Feed decoded frames from an incoming RTP audio track into the player."""
+    converter = PcmConverter(audio_player.sample_rate, audio_player.channels)
+    while True:
+        try:
+            frame = await track.recv()
+        except MediaStreamError:
+            break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error receiving audio track: {e}")
+            break
+        audio_player.write(converter.convert(frame))
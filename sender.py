@@ -0,0 +1,138 @@
+import asyncio
+from codec import OPUS, OPUS_LOW
+from config import AUDIO_SEND_BUDGET_MS, AUDIO_DROP_POLICY
+from framing import marker_frames, pack_silence
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DOWNGRADE = "downgrade"
+
+
+class AudioSender:
+    """
+    Per-participant send path that keeps the data channel's queue bounded.
+
+    Once more than `budget_ms` worth of frames is buffered on the channel
+    the policy kicks in:
+
+    - drop_oldest: stop sending until the channel drains below half the
+      budget, then skip the listener's backlog and resume at the live edge
+    - drop_newest: discard new frames until the channel drains
+    - downgrade: move an Opus listener to the low-bitrate stream until the
+      channel drains; other codecs fall back to drop_oldest
+
+    Frames the capture's VAD marks as silent are not sent. Sequenced
+    listeners get a silence marker covering the run instead, so playout
+    timing is kept; legacy listeners simply see a gap.
+    """
+
+    def __init__(self, data_channel, cursor, sequenced=False,
+                 budget_ms=AUDIO_SEND_BUDGET_MS, policy=AUDIO_DROP_POLICY):
+        self.data_channel = data_channel
+        self.cursor = cursor
+        self.sequenced = sequenced
+        self.budget_frames = max(1, int(budget_ms / cursor.capture.frame_ms))
+        self.policy = policy
+        self.sent = 0
+        self.dropped = 0
+        self.downgrades = 0
+        self.frame_size = 0
+        self.suppressed = 0
+        self.silence_start = None
+        self.silence_timestamp = 0
+        self.silence_frames = 0
+        self.marker_frames = marker_frames(cursor.capture.frame_ms)
+        self._drained = asyncio.Event()
+        data_channel.on("bufferedamountlow", self._on_drained)
+        data_channel.on("close", self._on_drained)
+
+    def _on_drained(self):
+        self._drained.set()
+        if self.cursor.codec == OPUS_LOW:
+            # Back under budget: return to full quality from the live edge
+            self.cursor.codec = OPUS
+            self.dropped += self.cursor.skip_to_live()
+
+    @property
+    def queue_depth(self):
+        """Bytes queued on the data channel but not yet handed to SCTP."""
+        return self.data_channel.bufferedAmount
+
+    @property
+    def over_budget(self):
+        return self.queue_depth > self.budget_frames * self.frame_size
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "lag_frames": self.cursor.lag,
+            "sent": self.sent,
+            "dropped": self.dropped + self.cursor.skipped,
+            "downgrades": self.downgrades,
+            "suppressed": self.suppressed,
+            "codec": self.cursor.codec,
+        }
+
+    async def send(self, seq, timestamp, payload, voiced=True):
+        """Send one frame, applying the drop policy if the channel is backed up."""
+        if not voiced:
+            self.suppressed += 1
+            if self.sequenced:
+                self._add_silence(seq, timestamp)
+            return
+        self.flush_silence()
+
+        if payload is None:
+            return
+        payload = self.cursor.capture.wire_frame(seq, timestamp, payload, self.sequenced)
+
+        self.frame_size = max(self.frame_size, len(payload))
+        self.data_channel.bufferedAmountLowThreshold = self.budget_frames * self.frame_size // 2
+
+        if self.over_budget:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return
+            if self.policy == DOWNGRADE and self.cursor.codec == OPUS:
+                self.cursor.codec = OPUS_LOW
+                self.downgrades += 1
+                self.dropped += 1 + self.cursor.skip_to_live()
+                return
+            # drop_oldest, and downgrade once there is nothing left to shed
+            await self._wait_drained()
+            self.dropped += 1 + self.cursor.skip_to_live()
+            return
+
+        self.data_channel.send(payload)
+        self.sent += 1
+
+    def _add_silence(self, seq, timestamp):
+        if self.silence_start is not None and seq != self.silence_start + self.silence_frames:
+            # The run was broken by dropped frames
+            self.flush_silence()
+        if self.silence_start is None:
+            self.silence_start = seq
+            self.silence_timestamp = timestamp
+        self.silence_frames += 1
+        if self.silence_frames >= self.marker_frames:
+            self.flush_silence()
+
+    def flush_silence(self):
+        """Send a marker for the pending run of silent frames, if any."""
+        if self.silence_start is None:
+            return
+        if self.data_channel.readyState == "open":
+            self.data_channel.send(
+                pack_silence(self.silence_start, self.silence_timestamp, self.silence_frames)
+            )
+        self.silence_start = None
+        self.silence_frames = 0
+
+    async def _wait_drained(self):
+        self._drained.clear()
+        while self.over_budget and self.data_channel.readyState == "open":
+            try:
+                await asyncio.wait_for(self._drained.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+            self._drained.clear()
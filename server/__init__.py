@@ -0,0 +1,3 @@
+from .signaling import SignalingServer
+
+__all__ = ["SignalingServer"]
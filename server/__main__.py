@@ -0,0 +1,16 @@
+import asyncio
+import os
+from .signaling import SignalingServer
+
+
+def main():
+    host = os.getenv("SIGNALING_HOST", "0.0.0.0")
+    port = int(os.getenv("SIGNALING_PORT", "8765"))
+    try:
+        asyncio.run(SignalingServer().serve(host, port))
+    except KeyboardInterrupt:
+        print("Stopping...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import websockets
+
+
+class SignalingServer:
+    """
+    Relays the jam signaling protocol between hosts and participants.
+
+    Hosts register a channel with a "connection" message. A participant's
+    "connection" is turned into a "send_offer" for the channel's host (or
+    answered with "not_found"), the host's "set_offer" is routed to the
+    participant and the participant's "set_answer" back to the host.
+    Trickled "candidate" messages follow the same two routes. Offers and
+    host candidates are only relayed from the host registered for the
+    participant's channel, answers and participant candidates only from
+    the socket the participant joined on.
+
+    Both lookups are plain dicts, channel id -> host socket and
+    participant id -> (socket, channel id), so routing a message costs the
+    same with ten clients or ten thousand.
+    """
+
+    def __init__(self):
+        self.hosts = {}
+        self.participants = {}
+
+    async def handler(self, websocket):
+        # What this socket registered, so it can be dropped on disconnect
+        channels = set()
+        participant_ids = set()
+        try:
+            async for message in websocket:
+                try:
+                    data = json.loads(message)
+                    await self.route(websocket, message, data, channels, participant_ids)
+                except websockets.ConnectionClosed:
+                    raise
+                except Exception as e:
+                    print(f"Error handling signaling message: {e}")
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for channel_id in channels:
+                if self.hosts.get(channel_id) is websocket:
+                    del self.hosts[channel_id]
+            for participant_id in participant_ids:
+                entry = self.participants.get(participant_id)
+                if entry and entry[0] is websocket:
+                    del self.participants[participant_id]
+
+    async def route(self, websocket, message, data, channels, participant_ids):
+        # Offers, answers and candidates are relayed as received, without re-encoding
+        kind = data.get('type')
+        client = data.get('client')
+
+        if kind == 'connection' and client == 'host':
+            channel_id = data['channel_id']
+            self.hosts[channel_id] = websocket
+            channels.add(channel_id)
+
+        elif kind == 'connection' and client == 'participant':
+            channel_id = data['channel_id']
+            participant_id = data['participant_id']
+            host = self.hosts.get(channel_id)
+            if host is None:
+                await websocket.send(json.dumps({'type': 'not_found', 'channel_id': channel_id}))
+                return
+            self.participants[participant_id] = (websocket, channel_id)
+            participant_ids.add(participant_id)
+            await self.forward(host, json.dumps({
+                'type': 'send_offer',
+                'channel_id': channel_id,
+                'participant_id': participant_id,
+                'codecs': data.get('codecs'),
+                'transports': data.get('transports'),
+                'features': data.get('features'),
+            }))
+
+        elif kind == 'set_offer' or (kind == 'candidate' and client == 'host'):
+            entry = self.participants.get(data['participant_id'])
+            # Only the host the participant joined through may negotiate with it
+            if entry and self.hosts.get(entry[1]) is websocket:
+                await self.forward(entry[0], message)
+
+        elif kind == 'set_answer' or kind == 'candidate':
+            entry = self.participants.get(data['participant_id'])
+            # ...and only the participant's own socket may answer for it
+            if entry and entry[0] is websocket:
+                host = self.hosts.get(entry[1])
+                if host:
+                    await self.forward(host, message)
+
+    async def forward(self, websocket, message):
+        try:
+            await websocket.send(message)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def serve(self, host="0.0.0.0", port=8765):
+        # Signaling messages are a few KB of SDP; per-connection deflate
+        # state would cost more memory than it saves bandwidth
+        async with websockets.serve(self.handler, host, port, compression=None):
+            print(f"Signaling server listening on ws://{host}:{port}/ws")
+            await asyncio.Future()
@@ -1,85 +1,20 @@
 import asyncio
 import websockets
 import uuid
-from aiortc import RTCPeerConnection, RTCSessionDescription, RTCIceServer, RTCConfiguration
-import subprocess
+from aiortc import RTCSessionDescription
 import json
-
-ice_servers = [
-    RTCIceServer(urls=["stun:stun.l.google.com:19302"]),
-    RTCIceServer(
-        urls=["turn:your.turn.server:3478"],
-        username="your_username",
-        credential="your_password"
-    )
-]
-rtc_config = RTCConfiguration(iceServers=ice_servers)
-
-class AudioPlayer:
-    def __init__(self, sample_rate=48000, channels=2):
-        self.sample_rate = sample_rate
-        self.channels = channels
-        self.process = None
-        self.start_process()
-
-    def start_process(self):
-        if self.process:
-            self.stop()
-        try:
-            self.process = subprocess.Popen(
-                [
-                    "paplay",
-                    "--rate", str(self.sample_rate),
-                    "--channels", str(self.channels),
-                    "--format=s16le",
-                    "--raw",
-                    "--latency-msec=1",
-                    "--process-time-msec=1"
-                ],
-                stdin=subprocess.PIPE,
-                bufsize=0,
-            )
-        except Exception as e:
-            print(f"Error starting audio process: {e}")
-            self.process = None
-
-    def play(self, audio_data):
-        try:
-            print(audio_data)
-            if self.process and self.process.poll() is None:
-                self.process.stdin.write(audio_data)
-                self.process.stdin.flush()
-                del audio_data
-            else:
-                self.start_process()
-        except BrokenPipeError:
-            self.stop()
-            self.start_process()
-        except Exception as e:
-            print(f"Error playing audio: {e}")
-            self.stop()
-                
-    def stop(self):
-        if self.process:
-            try:
-                if self.process.poll() is None:
-                    try:
-                        self.process.stdin.close()
-                    except:
-                        pass
-                    try:
-                        self.process.terminate()
-                        self.process.wait(timeout=1)
-                    except:
-                        self.process.kill()
-            except Exception as e:
-                print(f"Error stopping audio process: {e}")
-            self.process = None
-
-async def gather_complete(pc):
-    await asyncio.sleep(0.1)
-    while pc.iceGatheringState != "complete":
-        await asyncio.sleep(0.1)
+from certificate import create_peer_connection
+from codec import SUPPORTED_CODECS, PCM
+from config import RESUME_GRACE, SIGNALING_URI
+from framing import SUPPORTED_FEATURES
+from ice import (
+    ICE_FEATURES, add_remote_candidate, defer_server_candidates, local_sdp,
+    trickle_candidates,
+)
+from monitor import LoopLagMonitor
+from playback import AudioPlayer
+from reconnect import Reconnector
+from rtp import SUPPORTED_TRANSPORTS, play_track
 
 async def cleanup_connection(client_pc, audio_player, in_progress=False):
     """Helper function to clean up resources with protection against double cleanup"""
@@ -115,54 +50,113 @@ async def cleanup_connection(client_pc, audio_player, in_progress=False):
 
 async def connect():
     audio_player = AudioPlayer()
-    uri = "wss://jam-ws-server.onrender.com/ws"
+    loop_monitor = LoopLagMonitor().start()
+    uri = SIGNALING_URI
     client_pc = None
+    resume_deadline = None
+    resume_expiry = None
+    rejoins = None
+    leaving = False
     
     try:
         async with websockets.connect(uri) as websocket:
-            client_pc = RTCPeerConnection(rtc_config)
-            
-            @client_pc.on("iceconnectionstatechange")
-            def on_iceconnectionstatechange():
-                print(f"ICE connection state: {client_pc.iceConnectionState}")
+            def open_peer_connection():
+                nonlocal client_pc
+                pc = client_pc = create_peer_connection()
                 
-            @client_pc.on("connectionstatechange")
-            async def on_connectionstatechange():
-                print(f"Connection state changed to: {client_pc.connectionState}")
-                if client_pc.connectionState in ["failed", "closed", "disconnected"]:
-                    await cleanup_connection(client_pc, audio_player, True)
-            
-            @client_pc.on("datachannel")
-            def on_datachannel(channel):
-                print(f"Data channel {channel.label} received")
+                @pc.on("iceconnectionstatechange")
+                def on_iceconnectionstatechange():
+                    print(f"ICE connection state: {pc.iceConnectionState}")
+                    
+                @pc.on("connectionstatechange")
+                async def on_connectionstatechange():
+                    nonlocal resume_deadline, resume_expiry
+                    print(f"Connection state changed to: {pc.connectionState}")
+                    if pc.connectionState == "connected":
+                        resume_deadline = None
+                        if resume_expiry:
+                            resume_expiry.cancel()
+                            resume_expiry = None
+                    elif pc.connectionState in ["failed", "closed"]:
+                        await resume(pc)
+                
+                @pc.on("datachannel")
+                def on_datachannel(channel):
+                    print(f"Data channel {channel.label} received")
 
-                @channel.on("message")
-                def on_message(message):
-                    try:
-                        if channel.readyState == "open":
-                            audio_player.play(message)
-                            del message  # Help with garbage collection
-                    except Exception as e:
-                        if "not connected" not in str(e):  # Ignore expected disconnection errors
-                            print(f"Error handling audio message: {e}")
+                    @channel.on("message")
+                    def on_message(message):
+                        try:
+                            if channel.readyState == "open":
+                                audio_player.play(message)
+                                del message  # Help with garbage collection
+                        except Exception as e:
+                            if "not connected" not in str(e):  # Ignore expected disconnection errors
+                                print(f"Error handling audio message: {e}")
+
+                    @channel.on("close")
+                    def on_close():
+                        # The player is kept for a resumed connection
+                        print("Data channel closed")
+
+                @pc.on("track")
+                def on_track(track):
+                    print(f"Track {track.kind} received")
+                    if track.kind == "audio":
+                        asyncio.create_task(play_track(track, audio_player))
+
+                return pc
+
+            def give_up():
+                nonlocal leaving
+                print("Could not resume the connection")
+                leaving = True
+                asyncio.create_task(websocket.close())
 
-                @channel.on("close")
-                def on_close():
-                    print("Data channel closed")
-                    audio_player.stop()
+            async def resume(pc):
+                """
+                Renegotiate a dropped connection over the signaling socket,
+                keeping the socket and the player. Gives up after
+                RESUME_GRACE seconds without getting back to "connected".
+                """
+                nonlocal resume_deadline, resume_expiry, rejoins
+                if leaving or pc is not client_pc:
+                    return
+                if resume_deadline is None:
+                    rejoins = Reconnector()
+                    loop = asyncio.get_running_loop()
+                    resume_deadline = loop.time() + RESUME_GRACE
+                    # The replacement may never change state again, so the deadline
+                    # can't wait for the next change to be checked
+                    resume_expiry = loop.call_at(resume_deadline, give_up)
+                print("Connection lost, renegotiating")
+                replacement = open_peer_connection()
+                await cleanup_connection(pc, None)
+                await asyncio.sleep(1)
+                if leaving or replacement is not client_pc:
+                    return
+                try:
+                    await websocket.send(json.dumps(join_message))
+                except websockets.ConnectionClosed:
+                    pass  # the session is ending
+
+            open_peer_connection()
             
             channel_id = input("Enter Channel ID to join: ")
             participant_id = str(uuid.uuid4())
             
             try:
-                message = {
+                join_message = {
                     "client":"participant",
                     "type": "connection",
                     "channel_id":channel_id,
-                    "participant_id":participant_id
+                    "participant_id":participant_id,
+                    "codecs":SUPPORTED_CODECS,
+                    "transports":SUPPORTED_TRANSPORTS,
+                    "features":SUPPORTED_FEATURES + ICE_FEATURES
                 }
                 
-                await websocket.send(json.dumps(message))
+                await websocket.send(json.dumps(join_message))
                 
                 async for message in websocket:
                     try:
@@ -172,38 +166,63 @@ async def connect():
                                 sdp=data["sdp"],
                                 type='offer'
                             )
+                            audio_player.configure(
+                                data.get('codec', PCM),
+                                data.get('sequenced', False),
+                                data.get('frame_ms', 20),
+                                data.get('marker_frames', 1),
+                            )
                             
+                            trickle = data.get('trickle', False)
                             await client_pc.setRemoteDescription(offer)
                             answer = await client_pc.createAnswer()
+                            pending = defer_server_candidates(client_pc) if trickle else []
                             await client_pc.setLocalDescription(answer)
-                            await gather_complete(client_pc)
                             
                             message = {
                                 'client':'participant',
                                 'type':'set_answer',
                                 'channel_id':channel_id,
                                 'participant_id':participant_id,
-                                "sdp":client_pc.localDescription.sdp
+                                "sdp":local_sdp(client_pc, trickle)
                             }
                             await websocket.send(json.dumps(message))
+                            if trickle:
+                                asyncio.create_task(trickle_candidates(
+                                    pending, websocket,
+                                    {"client":"participant", "channel_id":channel_id, "participant_id":participant_id},
+                                ))
+
+                        elif data['type'] == 'candidate':
+                            await add_remote_candidate(client_pc, data)
                             
+                        elif data['type'] == 'not_found' and resume_deadline is not None:
+                            # The host may be reconnecting to signaling after the same outage;
+                            # ask again until the grace period runs out
+                            await asyncio.sleep(rejoins.delay())
+                            if resume_deadline is not None:
+                                await websocket.send(json.dumps(join_message))
+
                         elif data['type'] == 'not_found':
                             print(f"Channel ID {channel_id} not found. Please enter a valid Channel ID.")
                             channel_id = input("Enter Channel ID to join: ")
-                            message = {
+                            join_message = {
                                 "client":"participant",
                                 "type": "connection",
                                 "channel_id":channel_id,
-                                "participant_id":participant_id
+                                "participant_id":participant_id,
+                                "codecs":SUPPORTED_CODECS,
+                                "transports":SUPPORTED_TRANSPORTS,
+                                "features":SUPPORTED_FEATURES + ICE_FEATURES
                             }
-                            await websocket.send(json.dumps(message))
+                            await websocket.send(json.dumps(join_message))
                     except Exception as e:
                         print(f"Error processing message: {e}")
                         await cleanup_connection(client_pc, audio_player, True)
                         break
                 
                 # Keep connection alive
-                while True:
+                while not leaving:
                     await asyncio.sleep(1)
                     
             except Exception as e:
@@ -213,6 +232,12 @@ async def connect():
     except Exception as e:
         print(f"Fatal error: {e}")
     finally:
+        leaving = True
+        if resume_expiry:
+            resume_expiry.cancel()
+        loop_monitor.stop()
+        print(f"Event loop lag: {loop_monitor.stats()}")
+        print(f"Playback: {audio_player.stats()}")
         await cleanup_connection(client_pc, audio_player, True)
 
 if __name__ == "__main__":
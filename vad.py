@@ -0,0 +1,42 @@
+import numpy as np
+from config import VAD_OPEN_THRESHOLD, VAD_CLOSE_THRESHOLD
+
+
+class VoiceActivityDetector:
+    """
+    Energy gate with hysteresis and hangover over s16le frames.
+
+    Energy is a sum of squares in int64, computed into a preallocated work
+    buffer and compared against threshold**2 * samples, so no float
+    conversion, sqrt or per-frame array allocation is needed.
+    """
+
+    def __init__(self, hangover_frames, open_threshold=VAD_OPEN_THRESHOLD,
+                 close_threshold=VAD_CLOSE_THRESHOLD):
+        self.hangover_frames = hangover_frames
+        self.open_threshold = open_threshold
+        self.close_threshold = close_threshold
+        self.active = False
+        self.hangover = 0
+        self._work = np.zeros(0, dtype=np.int64)
+
+    def energy(self, pcm_data):
+        # Capture hands over int16 views of its ring; anything else is wrapped
+        samples = pcm_data if isinstance(pcm_data, np.ndarray) else np.frombuffer(pcm_data, dtype=np.int16)
+        if self._work.shape[0] != samples.shape[0]:
+            self._work = np.zeros(samples.shape[0], dtype=np.int64)
+        np.copyto(self._work, samples)
+        return int(np.dot(self._work, self._work)), samples.shape[0]
+
+    def update(self, pcm_data):
+        """Feed one frame; returns True while the frame should be sent as audio."""
+        energy, samples = self.energy(pcm_data)
+        if energy >= self.open_threshold * self.open_threshold * samples:
+            self.active = True
+            self.hangover = self.hangover_frames
+        elif self.active and energy < self.close_threshold * self.close_threshold * samples:
+            if self.hangover > 0:
+                self.hangover -= 1
+            else:
+                self.active = False
+        return self.active
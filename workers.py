@@ -0,0 +1,488 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import struct
+from multiprocessing.shared_memory import SharedMemory
+import websockets
+from capture import AudioCapture
+from codec import frame_bytes
+from config import HOST_WORKERS, TEARDOWN_TIMEOUT
+from framing import capture_timestamp
+from hub import ParticipantHub
+from monitor import LoopLagMonitor
+
+# Ring header: sequence number of the next frame to be written
+RING_HEADER = struct.Struct("=Q")
+# Slot header: sequence number + 1 (0 while being written), timestamp, voiced
+SLOT_HEADER = struct.Struct("=QIB")
+# Seconds between worker stats reports
+STATS_INTERVAL = 1.0
+# Seconds a worker gets to exit after its participants are closed
+EXIT_TIMEOUT = 1.0
+
+
+class FrameRing:
+    """
+    Captured frames in shared memory, written by the host and read by its
+    workers. The writer never waits: a slot is stamped with its sequence
+    number after its audio is copied in, and a reader that finds the stamp
+    changed while copying knows the frame was overwritten under it.
+    """
+
+    def __init__(self, frame_bytes, slots, name=None):
+        self.frame_bytes = frame_bytes
+        self.slots = slots
+        self.slot_size = SLOT_HEADER.size + frame_bytes
+        if name is None:
+            self.shm = SharedMemory(create=True, size=RING_HEADER.size + slots * self.slot_size)
+            self.owner = True
+        else:
+            # Workers share the host's resource tracker, so only the host unlinks
+            self.shm = SharedMemory(name)
+            self.owner = False
+        self.buf = self.shm.buf
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def head(self):
+        """Sequence number of the next frame to be written."""
+        return RING_HEADER.unpack_from(self.buf, 0)[0]
+
+    def _offset(self, seq):
+        return RING_HEADER.size + (seq % self.slots) * self.slot_size
+
+    def write(self, pcm_data, timestamp, voiced):
+        seq = self.head
+        offset = self._offset(seq)
+        start = offset + SLOT_HEADER.size
+        SLOT_HEADER.pack_into(self.buf, offset, 0, 0, 0)
+        self.buf[start:start + len(pcm_data)] = pcm_data
+        SLOT_HEADER.pack_into(self.buf, offset, seq + 1, timestamp, voiced)
+        RING_HEADER.pack_into(self.buf, 0, seq + 1)
+
+    def read_into(self, seq, target):
+        """
+        Copy frame `seq` into `target` and return (timestamp, voiced), or
+        None if it was overwritten (`target` may then hold part of it).
+        """
+        offset = self._offset(seq)
+        stamp, timestamp, voiced = SLOT_HEADER.unpack_from(self.buf, offset)
+        if stamp != seq + 1:
+            return None
+        start = offset + SLOT_HEADER.size
+        target[:] = self.buf[start:start + self.frame_bytes]
+        if SLOT_HEADER.unpack_from(self.buf, offset)[0] != seq + 1:
+            return None
+        return timestamp, bool(voiced)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingCapture(AudioCapture):
+    """
+    A worker's view of the host's capture: frames are copied out of the
+    shared ring whenever the host signals new ones on the notify pipe, then
+    served to this worker's listeners exactly like a local capture. Opus
+    tiers are encoded here, once per worker, for the listeners that use
+    them. Frames lost to the ring wrapping around become silence.
+    """
+
+    def __init__(self, ring, notify, frame_ms):
+        super().__init__(None, frame_ms, ring_ms=ring.slots * frame_ms)
+        self.shared = ring
+        self.notify = notify
+        self.silence = bytes(self.frame_bytes)
+
+    async def start(self):
+        if self.running:
+            return
+        self.seq = self.written = self.shared.head
+        self.running = True
+        os.set_blocking(self.notify.fileno(), False)
+        asyncio.get_running_loop().add_reader(self.notify.fileno(), self._notified)
+
+    def _notified(self):
+        try:
+            if not os.read(self.notify.fileno(), 4096):
+                # The host's capture has ended
+                asyncio.get_running_loop().remove_reader(self.notify.fileno())
+                self.running = False
+                self._wake()
+                return
+        except BlockingIOError:
+            return
+        self._copy()
+
+    def _copy(self):
+        head = self.shared.head
+        # Frames older than the local ring would be overwritten right away
+        self.seq = max(self.seq, head - len(self.ring))
+        while self.seq < head:
+            slot = self.seq % len(self.ring)
+            frame = self.shared.read_into(self.seq, self.ring[slot])
+            if frame is None:
+                self.ring[slot][:] = self.silence
+            timestamp, voiced = frame or (capture_timestamp(), False)
+            self.timestamps[slot] = timestamp
+            self.voiced[slot] = voiced
+            self._encode(slot, self.views[slot])
+            self.seq += 1
+        self.written = self.seq
+        self._wake()
+
+    async def stop(self):
+        if self.running:
+            asyncio.get_running_loop().remove_reader(self.notify.fileno())
+        self.running = False
+        self.cursors.clear()
+        self._wake()
+
+
+class ParentLink:
+    """Stands in for the signaling socket in a worker: messages go to the host."""
+
+    def __init__(self, control):
+        self.control = control
+
+    async def send(self, message):
+        self.control.send(("signal", message))
+
+
+def worker_main(ring_name, frame_ms, slots, control, notify):
+    """Entry point of a worker process."""
+    try:
+        asyncio.run(serve_participants(ring_name, frame_ms, slots, control, notify))
+    except KeyboardInterrupt:
+        pass
+
+
+async def serve_participants(ring_name, frame_ms, slots, control, notify):
+    """
+    Run the participants the host hands this worker until told to close or
+    the host goes away. Control messages from the host are ("offer", data,
+    generation), ("answer", data), ("candidate", data), ("drop",) and
+    ("close",); the worker answers with ("signal", message),
+    ("left", participant_id, generation), ("stats", stats) and
+    ("closed", forced).
+    """
+    loop = asyncio.get_running_loop()
+    ring = FrameRing(frame_bytes(frame_ms), slots, name=ring_name)
+    capture = RingCapture(ring, notify, frame_ms)
+    await capture.start()
+    generations = {}  # participant_id -> generation of its latest offer
+
+    def on_left(participant_id):
+        try:
+            control.send(("left", participant_id, generations.pop(participant_id, None)))
+        except OSError:
+            pass  # the host is gone
+
+    hub = ParticipantHub(capture, on_left).start()
+    link = ParentLink(control)
+    monitor = LoopLagMonitor().start()
+    messages = asyncio.Queue()
+
+    def on_control():
+        try:
+            while control.poll():
+                messages.put_nowait(control.recv())
+        except (EOFError, OSError):
+            # The host is gone; close everything
+            loop.remove_reader(control.fileno())
+            messages.put_nowait(("close",))
+
+    async def report():
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            try:
+                control.send(("stats", {**hub.stats(), "loop": monitor.stats()}))
+            except OSError:
+                return
+
+    loop.add_reader(control.fileno(), on_control)
+    reporter = asyncio.create_task(report())
+    try:
+        while True:
+            kind, *args = await messages.get()
+            if kind == "offer":
+                data, generation = args
+                generations[data['participant_id']] = generation
+                hub.offer(link, data)
+            elif kind == "answer":
+                await hub.answer(args[0])
+            elif kind == "candidate":
+                await hub.candidate(args[0])
+            elif kind == "drop":
+                await hub.drop_unanswered()
+            elif kind == "close":
+                forced = await hub.close_all()
+                try:
+                    control.send(("closed", forced))
+                except OSError:
+                    pass
+                break
+    finally:
+        reporter.cancel()
+        monitor.stop()
+        await hub.close()
+        await capture.stop()
+        ring.close()
+
+
+class WorkerProcess:
+    """The host's handle on one worker: its process, pipes and latest stats."""
+
+    def __init__(self, process, control, notify):
+        self.process = process
+        self.control = control
+        self.notify = notify
+        self.load = 0  # participants routed to it
+        self.stats = {}
+        self.alive = True
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def send(self, message):
+        try:
+            self.control.send(message)
+        except OSError as e:
+            print(f"Error sending to worker {self.process.pid}: {e}")
+
+
+class WorkerPool:
+    """
+    Spreads a host session's participants over worker processes. The host
+    keeps the capture and the signaling socket: each captured frame is
+    written once to a shared-memory ring the workers read, each join goes
+    to the worker with the fewest participants (a resuming participant
+    back to the one it was on) and signaling for a participant is
+    forwarded to its worker. Same interface as ParticipantHub.
+    """
+
+    def __init__(self, audio_capture, on_left=None, workers=HOST_WORKERS):
+        self.audio_capture = audio_capture
+        self.on_left = on_left
+        self.size = workers
+        self.workers = []
+        self.participants = {}  # participant_id -> (worker, generation)
+        self.answered = set()
+        self.generations = itertools.count()
+        self.ring = None
+        self.cursor = None
+        self.task = None
+        self.ws = None
+
+    def start(self):
+        if self.ring:
+            return self
+        loop = asyncio.get_running_loop()
+        capture = self.audio_capture
+        self.ring = FrameRing(capture.frame_bytes, len(capture.ring))
+        # Spawned, not forked: the host's event loop and sockets stay behind
+        context = multiprocessing.get_context("spawn")
+        for _ in range(self.size):
+            control, worker_control = context.Pipe()
+            notify_reader, notify = context.Pipe(duplex=False)
+            process = context.Process(
+                target=worker_main,
+                args=(self.ring.name, capture.frame_ms, self.ring.slots, worker_control, notify_reader),
+                daemon=True,
+            )
+            process.start()
+            worker_control.close()
+            notify_reader.close()
+            os.set_blocking(notify.fileno(), False)
+            worker = WorkerProcess(process, control, notify)
+            loop.add_reader(control.fileno(), self._receive, worker)
+            self.workers.append(worker)
+        self.cursor = capture.subscribe()
+        self.task = asyncio.create_task(self._feed())
+        return self
+
+    async def _feed(self):
+        try:
+            while True:
+                frame = await self.cursor.read()
+                if not frame:
+                    break
+                seq, timestamp, pcm_data, _, voiced = frame
+                self.ring.write(pcm_data, timestamp, voiced)
+                for worker in self.workers:
+                    if worker.alive:
+                        try:
+                            os.write(worker.notify.fileno(), b"\0")
+                        except BlockingIOError:
+                            pass  # it has wake-ups pending already
+                        except OSError:
+                            worker.alive = False
+        finally:
+            self.cursor.close()
+            # EOF on the notify pipes ends the workers' streams
+            for worker in self.workers:
+                if not worker.notify.closed:
+                    worker.notify.close()
+
+    def _receive(self, worker):
+        try:
+            while worker.control.poll():
+                self._handle(worker, worker.control.recv())
+        except (EOFError, OSError):
+            self._lost(worker)
+
+    def _handle(self, worker, message):
+        kind, *args = message
+        if kind == "signal":
+            asyncio.create_task(self._signal(args[0]))
+        elif kind == "left":
+            participant_id, generation = args
+            # A stale report for a participant that has rejoined since is ignored
+            if self.participants.get(participant_id) == (worker, generation):
+                self._remove(participant_id)
+                if self.on_left:
+                    self.on_left(participant_id)
+        elif kind == "stats":
+            worker.stats = args[0]
+        elif kind == "closed":
+            if not worker.closed.done():
+                worker.closed.set_result(args[0])
+
+    def _lost(self, worker):
+        asyncio.get_running_loop().remove_reader(worker.control.fileno())
+        if not worker.closed.done():
+            print(f"Worker {worker.process.pid} exited")
+            worker.closed.set_result(worker.load)
+        worker.alive = False
+        for participant_id, (routed, _) in list(self.participants.items()):
+            if routed is worker:
+                self._remove(participant_id)
+                if self.on_left:
+                    self.on_left(participant_id)
+
+    def _remove(self, participant_id):
+        worker, _ = self.participants.pop(participant_id)
+        worker.load -= 1
+        self.answered.discard(participant_id)
+
+    async def _signal(self, message):
+        if self.ws is None:
+            print("No signaling connection for a worker message")
+            return
+        try:
+            await self.ws.send(message)
+        except websockets.ConnectionClosed:
+            # Its participant rejoins once signaling is back
+            print("Signaling connection lost, worker message dropped")
+        except Exception as e:
+            print(f"Error relaying worker message: {e}")
+
+    def connected(self, ws):
+        """Signaling is (re)connected: workers' messages go out on `ws` from now on."""
+        self.ws = ws
+
+    def offer(self, ws, data):
+        participant_id = data['participant_id']
+        route = self.participants.get(participant_id)
+        if route:
+            worker = route[0]
+        else:
+            alive = [worker for worker in self.workers if worker.alive]
+            if not alive:
+                print(f"No worker left for participant {participant_id}")
+                return
+            worker = min(alive, key=lambda worker: worker.load)
+            worker.load += 1
+        generation = next(self.generations)
+        self.participants[participant_id] = (worker, generation)
+        self.answered.discard(participant_id)
+        worker.send(("offer", data, generation))
+
+    async def answer(self, data):
+        route = self.participants.get(data['participant_id'])
+        if not route:
+            print(f"Participant {data['participant_id']} not found for answer")
+            return
+        self.answered.add(data['participant_id'])
+        route[0].send(("answer", data))
+
+    async def candidate(self, data):
+        route = self.participants.get(data['participant_id'])
+        if route:
+            route[0].send(("candidate", data))
+
+    async def drop_unanswered(self):
+        for participant_id in list(self.participants):
+            if participant_id not in self.answered:
+                self._remove(participant_id)
+                # The worker's own report is ignored once the route is gone
+                if self.on_left:
+                    self.on_left(participant_id)
+        for worker in self.workers:
+            if worker.alive:
+                worker.send(("drop",))
+        return list(self.participants)
+
+    async def close_all(self):
+        """Have every worker close its participants. Returns how many were forced."""
+        for worker in self.workers:
+            if worker.alive and not worker.closed.done():
+                worker.send(("close",))
+        forced = 0
+        for worker in self.workers:
+            try:
+                forced += await asyncio.wait_for(asyncio.shield(worker.closed), TEARDOWN_TIMEOUT + EXIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                forced += worker.load
+        self.participants.clear()
+        self.answered.clear()
+        for worker in self.workers:
+            worker.load = 0
+        return forced
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if any(not worker.closed.done() for worker in self.workers):
+            await self.close_all()
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            if not worker.control.closed:
+                loop.remove_reader(worker.control.fileno())
+                worker.control.close()
+            if not worker.notify.closed:
+                worker.notify.close()
+            await loop.run_in_executor(None, worker.process.join, EXIT_TIMEOUT)
+            if worker.process.is_alive():
+                worker.process.kill()
+        self.workers = []
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+
+    def stats(self):
+        pools = [worker.stats["pool"] for worker in self.workers if worker.stats.get("pool")]
+        participants = {}
+        for worker in self.workers:
+            participants.update(worker.stats.get("participants", {}))
+        return {
+            "pool": {
+                key: sum(pool[key] for pool in pools) for key in ("ready", "hits", "misses")
+            } if pools else None,
+            "workers": [
+                {
+                    "pid": worker.process.pid,
+                    "alive": worker.alive,
+                    "participants": worker.load,
+                    "loop": worker.stats.get("loop"),
+                }
+                for worker in self.workers
+            ],
+            "participants": participants,
+        }